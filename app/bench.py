@@ -0,0 +1,363 @@
+"""Benchmarks for the triage hot paths.
+
+    python -m app.bench -o bench-$(git rev-parse --short HEAD).json
+    python -m app.bench --only rules,vitals,process --sizes 10000
+    python -m app.bench --compare bench-old.json bench-new.json
+
+Patients come from a seeded generator that builds, for every rule in RULES, a case that
+fires it (checked with fired_rules) and mixes in random patients for the fallback and
+rule interactions. Each benchmark reports per-call latency percentiles and ops/sec; the
+JSON output also records the commit, Python/NumPy versions and RULESET_VERSION so runs
+from two commits can be compared. HTTP benchmarks go through the FastAPI app in-process
+(TestClient) against a temporary store, never the app's own records/feedback/database.
+"""
+import argparse, json, os, platform, random, statistics, subprocess, sys, tempfile, time
+from datetime import datetime, timedelta
+from typing import Callable, Iterable, List
+
+import numpy as np
+
+from app import rules as rules_mod
+from app.rules import MATCHER, NUMERIC_FIELDS, RULES, SYMPTOMATIC_HIGH, SYMPTOMATIC_LOW, fired_rules, patient_fields
+from app.triage import VITAL_FIELDS, VITAL_INPUTS, VITAL_RANGES, classify_vital_signs, classify_vital_signs_batch, triage, triage_memo
+
+GROUPS = ("startup", "rules", "vitals", "process", "radar", "graph", "analytics")
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+# /process declares these as int form fields; everything else numeric is a float
+INT_FIELDS = {"Systolic", "Diastolic", "hr", "O2_Sat", "RR", "GCS", "Pain_Scale"}
+NOISE = ("since this morning", "on and off", "getting worse", "brought by family", "first episode", "no known allergies")
+
+# ---------- Synthetic patients ----------
+def _field_value(rng: random.Random, field: str):
+    lo, hi = VITAL_RANGES[field]["normal" if rng.random() < 0.6 else "valid"]
+    return rng.randint(int(lo), int(hi)) if field in INT_FIELDS else round(rng.uniform(lo, hi), 1)
+
+def random_patient(rng: random.Random) -> tuple:
+    """triage() arguments with plausible vitals (some missing) and a few rule terms."""
+    vitals = {k: (_field_value(rng, k) if rng.random() < 0.85 else None) for k in NUMERIC_FIELDS}
+    vitals["Location_of_Pain"] = rng.choice(("Central", "Peripheral", None))
+    vitals["Pain_Duration"] = rng.choice(("Acute", "Chronic", "Recurrent", None))
+    vitals["blood_glucose_symptoms"] = rng.choice(SYMPTOMATIC_LOW + SYMPTOMATIC_HIGH + (None, None))
+    terms = sorted(rules_mod.CHIEF_TERMS)
+    chief = ", ".join(rng.sample(terms, rng.randint(0, 2)) + rng.sample(NOISE, 1))
+    history = ", ".join(rng.sample(sorted(rules_mod.HIST_TERMS), rng.randint(0, 1)) + rng.sample(NOISE, 1))
+    return vitals, chief, history, rng.random() < 0.5, rng.choice(("Severe", "Moderate", "Mild", "None", ""))
+
+def _atom_value(rng: random.Random, field: str, op: str, *args):
+    """A value satisfying one rule atom, at or next to the threshold to exercise boundaries."""
+    step = 1 if field in INT_FIELDS else 0.5
+    if op == "<":  return args[0] - step
+    if op == ">":  return args[0] + step
+    if op in ("<=", ">=", "==", "[)"): return args[0]
+    if op == "[]":
+        a, b = args
+        return rng.choice((a, b, rng.randint(a, b) if field in INT_FIELDS else round(rng.uniform(a, b), 1)))
+    if op == "in": return rng.choice(args[0])
+    if op == "true": return True
+    if op == "false": return False
+    # "!=" / "not in": some other value of the field
+    taken = args[0] if op == "not in" else (args[0],)
+    pool = {"Pain_Duration": ("Chronic", "Recurrent", "Subacute"),
+            "blood_glucose_symptoms": SYMPTOMATIC_LOW + SYMPTOMATIC_HIGH + ("",)}.get(field, ("Other",))
+    return rng.choice([v for v in pool if v not in taken])
+
+def rule_patient(rng: random.Random, i: int, tries: int = 50) -> tuple:
+    """triage() arguments for a patient that fires RULES[i] (other rules may fire too)."""
+    rule = RULES[i]
+    for _ in range(tries):
+        vitals, _, _, symptoms, distress = random_patient(rng)
+        fields = {"symptoms_present": symptoms, "distress_level": distress}
+        for g in rules_mod._groups(rule.when):
+            field, op, *args = rng.choice(g)
+            value = _atom_value(rng, field, op, *args)
+            (fields if field in fields else vitals)[field] = value
+        terms = list(rule.chief) + [rng.choice(g) for g in rule.chief_any]
+        chief = ", ".join(dict.fromkeys(terms + [rng.choice(NOISE)]))
+        history = ", ".join([rng.choice(rule.hist_any)] if rule.hist_any else [rng.choice(NOISE)])
+        p = patient_fields(vitals, fields["symptoms_present"], fields["distress_level"])
+        if i in fired_rules(p, MATCHER.find(chief), MATCHER.find(history)):
+            return vitals, chief, history, fields["symptoms_present"], fields["distress_level"]
+    raise ValueError(f"could not build a patient for rule {i}: {rule.desc}")
+
+def synthetic_patients(n: int, seed: int = 0, targeted: float = 0.7) -> List[tuple]:
+    """n patients: the first len(RULES) fire each rule once, then `targeted` of the rest
+    cycle through the rules again and the others are random."""
+    rng = random.Random(seed)
+    out = []
+    for k in range(n):
+        if k < len(RULES) or rng.random() < targeted:
+            out.append(rule_patient(rng, k % len(RULES)))
+        else:
+            out.append(random_patient(rng))
+    return out
+
+def rule_coverage(patients: Iterable[tuple]) -> dict:
+    fired = [0] * len(RULES)
+    fallback = 0
+    for vitals, chief, history, symptoms, distress in patients:
+        hit = fired_rules(patient_fields(vitals, symptoms, distress), MATCHER.find(chief or ""), MATCHER.find(history or ""))
+        for i in hit: fired[i] += 1
+        fallback += not hit
+    return {"rules": len(RULES), "covered": sum(1 for c in fired if c), "fallback": fallback,
+            "missing": [RULES[i].desc for i, c in enumerate(fired) if not c]}
+
+def form_fields(patient: tuple) -> dict:
+    """triage() arguments -> /process form data."""
+    vitals, chief, history, symptoms, distress = patient
+    form = {field: vitals[key] for field, key in VITAL_INPUTS.items() if vitals.get(key) not in (None, "")}
+    form.update(chief_complaint=chief, history=history, symptoms_present="yes" if symptoms else "no", distress_level=distress)
+    return form
+
+def batch_columns(patients: List[tuple]) -> tuple:
+    """determine_ctas_batch arguments for a list of patients."""
+    vit = [p[0] for p in patients]
+    cols = {k: np.array([rules_mod.num(v.get(k)) for v in vit], dtype=float) for k in NUMERIC_FIELDS}
+    for k in ("Location_of_Pain", "Pain_Duration", "blood_glucose_symptoms"):
+        cols[k] = [v.get(k) or "" for v in vit]
+    return cols, [p[1] or "" for p in patients], [p[2] or "" for p in patients], [p[3] for p in patients], [p[4] or "" for p in patients]
+
+# ---------- Timing ----------
+def summarize(times: List[float], per_call: int = 1) -> dict:
+    """Latency percentiles (microseconds per item) and items/sec over `times` seconds per call."""
+    us = sorted(t * 1e6 / per_call for t in times)
+    pick = lambda q: round(us[min(len(us) - 1, int(q * len(us)))], 2)
+    return {"n": len(us) * per_call, "mean_us": round(statistics.fmean(us), 2), "p50_us": pick(0.5),
+            "p95_us": pick(0.95), "p99_us": pick(0.99), "max_us": round(us[-1], 2),
+            "ops_per_sec": round(len(us) * per_call / sum(times), 1) if sum(times) else None}
+
+def measure(fn: Callable, items: Iterable, warmup: int = 20, per_call: int = 1) -> dict:
+    items = list(items)
+    for x in items[:warmup]: fn(x)
+    times = []
+    for x in items:
+        t = time.perf_counter(); fn(x); times.append(time.perf_counter() - t)
+    return summarize(times, per_call)
+
+def timed(fn: Callable):
+    t = time.perf_counter(); out = fn()
+    return out, time.perf_counter() - t
+
+# ---------- Benchmarks ----------
+STARTUP_PROBE = ("import sys, time; t = time.perf_counter(); import app.main; "
+                 "print(time.perf_counter() - t, *(m in sys.modules for m in ('numpy', 'matplotlib')))")
+
+def bench_startup(res: dict, args):
+    """Fresh interpreters importing app.main: what every (re)started uvicorn worker pays."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    imports, walls = [], []
+    for _ in range(args.startups):
+        t = time.perf_counter()
+        out = subprocess.run([sys.executable, "-c", STARTUP_PROBE], capture_output=True, text=True, check=True, cwd=root).stdout.split()
+        walls.append(time.perf_counter() - t)
+        imports.append(float(out[0]))
+    res["startup.import_app_main"] = {**summarize(imports), "numpy_loaded": out[1] == "True", "matplotlib_loaded": out[2] == "True"}
+    res["startup.process"] = summarize(walls)
+
+def bench_rules(patients: List[tuple], res: dict, args):
+    scalar = [({k: v for k, v in vit.items() if v not in (None, "")}, c or "", h or "", s, d or "")
+              for vit, c, h, s, d in patients]
+    res["rules.determine_ctas"] = measure(lambda p: rules_mod.determine_ctas(*p), scalar)
+    cols = batch_columns(patients)
+    res["rules.determine_ctas_batch"] = measure(lambda _: rules_mod.determine_ctas_batch(*cols), range(args.repeat),
+                                                warmup=1, per_call=len(patients))
+    triage_memo.clear()     # the patients are distinct, so this is the uncached path plus the memo lookup
+    res["rules.triage"] = measure(lambda p: triage(*p), patients, warmup=0)
+
+def bench_vitals(patients: List[tuple], res: dict, args):
+    vit = [p[0] for p in patients]
+    res["vitals.classify_vital_signs"] = measure(classify_vital_signs, vit)
+    grid = np.array([[rules_mod.num(v.get(k)) for k in VITAL_FIELDS] for v in vit], dtype=float)
+    res["vitals.classify_vital_signs_batch"] = measure(lambda _: classify_vital_signs_batch(grid), range(args.repeat),
+                                                       warmup=1, per_call=len(vit))
+
+class App:
+    """app.main bound to a benchmark store in `tmp`; imported on first use (it pulls in matplotlib)."""
+
+    def __init__(self, tmp: str):
+        from fastapi.testclient import TestClient
+        import app.main as m
+        self.m, self.TestClient, self.tmp = m, TestClient, tmp
+
+    def use(self, storage):
+        from app.writer import WriteQueue
+        m = self.m
+        m.storage = storage
+        m.writer = WriteQueue(storage, on_written=m.event_hub.publish_batch)
+        m.analytics_snapshot = {"version": None, "etag": "", "body": b""}
+
+    def client(self):
+        return self.TestClient(self.m.app)
+
+def bench_process(app: App, patients: List[tuple], res: dict, args):
+    from app.storage import make_storage
+    tmp = tempfile.mkdtemp(dir=app.tmp)
+    app.use(make_storage(args.backend, os.path.join(tmp, "records.json"), os.path.join(tmp, "feedback.json"),
+                         os.path.join(tmp, "triage.db")))
+    app.m.triage_memo.clear()
+    forms = [form_fields(p) for p in patients[:args.requests]]
+    with app.client() as c:     # startup/shutdown run: the write queue flushes in the background
+        def post(form):
+            r = c.post("/process", data=form)
+            assert r.status_code == 200, r.text[:200]
+        res["http.process"] = measure(post, forms)
+
+def bench_radar(app: App, res: dict, args):
+    from app.radar import render_radar
+    counts = [tuple(random.Random(i).randint(0, 9) for _ in range(5)) for i in range(args.renders)]
+    res["radar.render_png_300dpi"] = measure(lambda k: render_radar(k, "png", 300), counts, warmup=2)
+    res["radar.render_svg"] = measure(lambda k: render_radar(k, "svg"), counts, warmup=2)
+    reasons = [", ".join(f"CTAS {lvl}" for lvl, n in enumerate(k, 1) for _ in range(n)) or "none" for k in counts]
+    with app.client() as c:     # through the render pool, as deployed
+        def get(reason, **headers):
+            r = c.get("/radar_chart", params={"reason": reason}, headers=headers)
+            assert r.status_code in (200, 304), r.text[:200]
+            return r
+        app.m.radar_cache.clear()
+        res["http.radar_chart.miss"] = measure(get, reasons, warmup=0)
+        res["http.radar_chart.hit"] = measure(get, reasons, warmup=0)
+        etags = [get(r).headers["etag"] for r in reasons]
+        res["http.radar_chart.304"] = measure(lambda x: get(x[0], **{"If-None-Match": x[1]}), zip(reasons, etags))
+
+def bench_graph(app: App, patients: List[tuple], res: dict, args):
+    queries = []
+    for vitals, chief, history, symptoms, distress in patients[:args.requests]:
+        _, reason = rules_mod.determine_ctas({k: v for k, v in vitals.items() if v not in (None, "")},
+                                             chief, history, symptoms, distress)
+        queries.append({"reason": ",".join(reason), "chief": chief, "history": history})
+    c = app.client()
+    get = lambda q: c.get("/graph_data", params=q)
+    app.m.graph_cache.clear()
+    res["http.graph_data.miss"] = measure(get, queries, warmup=0)
+    res["http.graph_data.hit"] = measure(get, queries)
+
+def fill_store(storage, patients: List[tuple], n: int, chunk: int = 10_000):
+    """n records cycled from the patients' real triage results, plus ~1 feedback per 10 records."""
+    base = [triage(*p)[3] for p in patients]
+    t0 = datetime(2024, 1, 1)
+    done = 0
+    while done < n:
+        k = min(chunk, n - done)
+        recs = [{**base[(done + j) % len(base)], "timestamp": str(t0 + timedelta(seconds=done + j))} for j in range(k)]
+        fbs = [{"timestamp": r["timestamp"], "decision": "accept" if j % 3 else "decline", "ctas_level": r["ctas_level"],
+                "chief_complaint": r["chief_complaint"], "history": r["history"], "reason": r["reason"]}
+               for j, r in enumerate(recs[::10])]
+        storage.write_batch(recs, fbs)
+        done += k
+
+def bench_analytics(app: App, patients: List[tuple], res: dict, args):
+    from app.storage import make_storage
+    for n in args.sizes:
+        tmp = tempfile.mkdtemp(dir=app.tmp)
+        paths = (os.path.join(tmp, "records.json"), os.path.join(tmp, "feedback.json"), os.path.join(tmp, "triage.db"))
+        filler = make_storage(args.backend, *paths)
+        filler.open()
+        _, secs = timed(lambda: fill_store(filler, patients, n))
+        filler.close()
+        key = f"{args.backend}.{n}"
+        res[f"analytics.{key}.fill"] = {"n": n, "seconds": round(secs, 3), "ops_per_sec": round(n / secs, 1)}
+        if args.backend == "jsonl":    # startup from the saved indexes, then with the indexes gone
+            storage = make_storage(args.backend, *paths)
+            _, secs = timed(storage.open)
+            res[f"analytics.{key}.open_indexed"] = {"n": n, "seconds": round(secs, 3)}
+            storage.close()
+            for p in paths[:2]: os.remove(p + ".idx")
+        storage = make_storage(args.backend, *paths)
+        _, secs = timed(storage.open)      # cold start: view rebuilt from what is on disk
+        res[f"analytics.{key}.open"] = {"n": n, "seconds": round(secs, 3), "ops_per_sec": round(n / secs, 1)}
+        app.use(storage)
+        c = app.client()
+        r = c.get("/analytics")
+        assert r.json()["samples"] == n, r.text[:200]
+        res[f"http.analytics.{key}"] = measure(lambda _: c.get("/analytics"), range(args.requests))
+        res[f"http.analytics_by_ctas.{key}"] = measure(lambda _: c.get("/analytics_by_ctas"), range(args.requests))
+        etag = c.get("/analytics_by_ctas").headers["etag"]
+        res[f"http.analytics_by_ctas.{key}.304"] = measure(
+            lambda _: c.get("/analytics_by_ctas", headers={"If-None-Match": etag}), range(args.requests))
+
+        def rebuild(_):
+            app.m.analytics_snapshot = {"version": None, "etag": "", "body": b""}
+            c.get("/analytics_by_ctas")
+        res[f"http.analytics_by_ctas.{key}.rebuild"] = measure(rebuild, range(min(args.requests, 50)), warmup=2)
+        storage.close()
+
+# ---------- Driver ----------
+def git_commit() -> dict:
+    run = lambda *a: subprocess.run(["git", *a], capture_output=True, text=True).stdout.strip()
+    try:
+        return {"commit": run("rev-parse", "HEAD") or None, "dirty": bool(run("status", "--porcelain", "--untracked-files=no"))}
+    except OSError:
+        return {"commit": None, "dirty": None}
+
+def run(args) -> dict:
+    patients, secs = timed(lambda: synthetic_patients(args.patients, args.seed))
+    out = {"meta": {**git_commit(), "time": datetime.now().isoformat(timespec="seconds"),
+                    "python": platform.python_version(), "numpy": np.__version__, "platform": platform.platform(),
+                    "cpus": os.cpu_count(), "ruleset": rules_mod.RULESET_VERSION, "seed": args.seed,
+                    "patients": args.patients, "backend": args.backend, "coverage": rule_coverage(patients)},
+           "results": {}}
+    res = out["results"]
+    log = lambda msg: print(msg, file=sys.stderr) if not args.quiet else None
+    log(f"{len(patients)} patients in {secs:.1f}s; coverage {out['meta']['coverage']['covered']}/{len(RULES)} rules")
+    if "startup" in args.only: bench_startup(res, args); log("startup done")
+    if "rules" in args.only: bench_rules(patients, res, args); log("rules done")
+    if "vitals" in args.only: bench_vitals(patients, res, args); log("vitals done")
+    if set(args.only) & {"process", "radar", "graph", "analytics"}:
+        with tempfile.TemporaryDirectory() as tmp:
+            app = App(tmp)
+            if "process" in args.only: bench_process(app, patients, res, args); log("process done")
+            if "radar" in args.only: bench_radar(app, res, args); log("radar done")
+            if "graph" in args.only: bench_graph(app, patients, res, args); log("graph done")
+            if "analytics" in args.only: bench_analytics(app, patients, res, args); log("analytics done")
+    return out
+
+def compare(old_path: str, new_path: str, threshold: float) -> int:
+    """Print the p50 change per benchmark; returns the number beyond `threshold` percent slower."""
+    with open(old_path, "r", encoding="utf-8") as f: old = json.load(f)
+    with open(new_path, "r", encoding="utf-8") as f: new = json.load(f)
+    print(f"old: {old['meta'].get('commit')}  new: {new['meta'].get('commit')}")
+    if old["meta"].get("cpus") != new["meta"].get("cpus") or old["meta"].get("python") != new["meta"].get("python"):
+        print("warning: runs come from different machines/Pythons")
+    regressions = 0
+    for name in sorted(set(old["results"]) & set(new["results"])):
+        a, b = old["results"][name], new["results"][name]
+        metric = "p50_us" if "p50_us" in a and "p50_us" in b else "seconds"
+        if not a.get(metric) or b.get(metric) is None: continue
+        change = 100 * (b[metric] - a[metric]) / a[metric]
+        flag = ""
+        if change > threshold: flag, regressions = "  REGRESSION", regressions + 1
+        elif change < -threshold: flag = "  faster"
+        print(f"{name:<52} {a[metric]:>12.2f} -> {b[metric]:>12.2f} {metric:<8} {change:+7.1f}%{flag}")
+    for name in sorted(set(old["results"]) ^ set(new["results"])):
+        print(f"{name:<52} only in {'old' if name in old['results'] else 'new'}")
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m app.bench", description="Benchmark the triage hot paths.")
+    ap.add_argument("-o", "--output", help="write the JSON results here (default: stdout)")
+    ap.add_argument("--only", default=",".join(GROUPS), help=f"comma-separated subset of {','.join(GROUPS)}")
+    ap.add_argument("--patients", type=int, default=5000, help="synthetic patients for the rule/vital benchmarks")
+    ap.add_argument("--requests", type=int, default=300, help="HTTP requests per endpoint benchmark")
+    ap.add_argument("--renders", type=int, default=20, help="distinct radar charts to render")
+    ap.add_argument("--repeat", type=int, default=5, help="passes for the batch benchmarks")
+    ap.add_argument("--startups", type=int, default=5, help="fresh interpreters for the startup benchmark")
+    ap.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="stored-record counts for analytics")
+    ap.add_argument("--backend", choices=("sqlite", "jsonl"), default="sqlite", help="store used for HTTP benchmarks")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--quiet", action="store_true")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files instead of running")
+    ap.add_argument("--threshold", type=float, default=10.0, help="percent slowdown --compare reports as a regression")
+    args = ap.parse_args(argv)
+    if args.compare:
+        sys.exit(1 if compare(*args.compare, args.threshold) else 0)
+    args.only = [g.strip() for g in args.only.split(",") if g.strip()]
+    unknown = set(args.only) - set(GROUPS)
+    if unknown: ap.error(f"unknown benchmark group(s): {', '.join(sorted(unknown))}")
+    args.sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    out = json.dumps(run(args), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f: f.write(out + "\n")
+    else:
+        print(out)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+class LRUCache:
+    """Thread-safe LRU bounded by entry count and/or total size (len() of values, e.g. bytes)."""
+
+    def __init__(self, max_entries: Optional[int] = None, max_bytes: Optional[int] = None):
+        self.max_entries, self.max_bytes = max_entries, max_bytes
+        self.data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.size = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def _cost(self, value) -> int:
+        return len(value) if self.max_bytes is not None else 0
+
+    def get(self, key):
+        with self.lock:
+            try:
+                value = self.data[key]
+            except KeyError:
+                self.misses += 1
+                return None
+            self.data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        cost = self._cost(value)
+        if self.max_bytes is not None and cost > self.max_bytes:
+            return
+        with self.lock:
+            if key in self.data:
+                self.size -= self._cost(self.data.pop(key))
+            self.data[key] = value
+            self.size += cost
+            while self.data and ((self.max_entries is not None and len(self.data) > self.max_entries)
+                                 or (self.max_bytes is not None and self.size > self.max_bytes)):
+                _, old = self.data.popitem(last=False)
+                self.size -= self._cost(old)
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.data.clear(); self.size = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            total = self.hits + self.misses
+            return {"entries": len(self.data), "bytes": self.size, "hits": self.hits, "misses": self.misses,
+                    "evictions": self.evictions, "hit_rate": round(self.hits / total, 4) if total else None}
+
+class VersionedLRU(LRUCache):
+    """LRUCache that empties itself whenever version() changes (e.g. the rule set was edited)."""
+
+    def __init__(self, version, **kw):
+        super().__init__(**kw)
+        self.version = version
+        self.current = version()
+        self.invalidations = 0
+
+    def _check(self):
+        v = self.version()
+        if v != self.current:
+            self.clear()
+            self.current = v
+            self.invalidations += 1
+
+    def get(self, key):
+        self._check()
+        return super().get(key)
+
+    def put(self, key, value):
+        self._check()
+        super().put(key, value)
+
+    def stats(self) -> dict:
+        return {**super().stats(), "version": self.current, "invalidations": self.invalidations}
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """RFC 7232 weak comparison of an If-None-Match header against our ETag."""
+    if not if_none_match:
+        return False
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in (t[2:] if t.startswith("W/") else t for t in tags)
@@ -0,0 +1,139 @@
+import asyncio, json, logging, time
+from typing import Callable, List, Optional, Set
+
+from app.storage import feedback_card, feedback_decision, feedback_level, record_card, record_level
+
+class Subscriber:
+    def __init__(self, max_queue: int):
+        self.queue: asyncio.Queue = asyncio.Queue(max_queue)
+        self.dropped = False
+        self.since = time.time()
+
+class EventHub:
+    """Fan-out of newly written records and feedback to server-sent-event clients.
+
+    Each event is encoded once and pushed onto every subscriber's bounded queue; a client
+    that falls `max_queue` events behind is disconnected (it reconnects and re-reads the
+    analytics endpoints) instead of buffering without limit.
+
+    Events are numbered by the storage sequence (`seq` from Storage.counts(): rows in the
+    view, which every worker agrees on). A delta event carries the `seq` after it and the
+    `n` rows it covers, so a client holding a snapshot at `seq` drops events at or below it
+    and re-reads the snapshot on a gap. Deltas are only sent for this process's writes
+    when they directly follow the last published seq; anything else (rows written by other
+    workers, a rebuilt view) goes out as a `sync` event with the full counters from
+    follow(), which polls storage every `sync_every` seconds while clients are connected.
+    """
+
+    def __init__(self, max_queue: int = 256, max_clients: int = 500, heartbeat: float = 15.0, burst: int = 32,
+                 sync_every: float = 1.0):
+        self.max_queue, self.max_clients, self.heartbeat = max_queue, max_clients, heartbeat
+        self.burst = burst      # larger record batches (bulk API) go out as one summed `records` event
+        self.sync_every = sync_every
+        self.subs: Set[Subscriber] = set()
+        self.seq = -1           # storage seq of the last event; -1 until the first sync
+        self.wake: Optional[asyncio.Event] = None
+        self.published = self.slow_drops = self.syncs = 0
+
+    def subscribe(self) -> Optional[Subscriber]:
+        if len(self.subs) >= self.max_clients:
+            return None
+        sub = Subscriber(self.max_queue)
+        self.subs.add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscriber):
+        self.subs.discard(sub)
+
+    def publish(self, event: str, data: dict):
+        """Send `data` (stamped with the current seq) to every subscriber."""
+        if not self.subs: return
+        data["seq"] = self.seq
+        frame = f"id: {self.seq}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode("utf-8")
+        for sub in list(self.subs):
+            try:
+                sub.queue.put_nowait(frame)
+            except asyncio.QueueFull:
+                sub.dropped = True
+                self.subs.discard(sub)
+                self.slow_drops += 1
+        self.published += 1
+
+    def publish_batch(self, recs: List[dict], fbs: List[dict], seq: int):
+        """WriteQueue hook: one event per written record/feedback with its counter deltas.
+
+        `seq` is the storage seq right after the write. Unless the batch accounts for all of
+        the rows since the last event, follow() is woken to send a sync instead.
+        """
+        if not self.subs: return
+        if seq <= self.seq: return      # already covered by a sync
+        if seq - len(recs) - len(fbs) != self.seq:
+            if self.wake: self.wake.set()
+            return
+        if len(recs) > self.burst:
+            totals: dict = {}
+            for r in recs:
+                lvl = record_level(r)
+                if lvl is not None: totals[f"CTAS {lvl}"] = totals.get(f"CTAS {lvl}", 0) + 1
+            self.seq += len(recs)
+            self.publish("records", {"count": len(recs), "n": len(recs), "delta": {"samples": len(recs), "totals": totals}})
+            recs = []
+        for r in recs:
+            lvl = record_level(r)
+            key = f"CTAS {lvl}" if lvl is not None else None
+            delta = {"samples": 1, **({"totals": {key: 1}} if key else {})}
+            self.seq += 1
+            self.publish("record", {"card": record_card(r, key) if key else None, "n": 1, "delta": delta})
+        for fb in fbs:
+            d = feedback_decision(fb)
+            lvl = feedback_level(fb) if d in ("accept", "decline") else None
+            key = f"CTAS {lvl}" if lvl is not None else None
+            delta = {"feedback": 1}
+            if d in ("accept", "decline"):
+                name = "accepted" if d == "accept" else "declined"
+                delta[name] = 1
+                if key: delta["by_ctas"] = {name: {key: 1}}
+            self.seq += 1
+            self.publish("feedback", {"decision": d, "card": feedback_card(fb, key) if key else None, "n": 1, "delta": delta})
+
+    async def follow(self, snapshot: Callable[[], dict]):
+        """Background task: while clients are connected, send a `sync` event with `snapshot()`
+        (run in a thread; a dict with the storage `seq`) whenever storage moved past the last
+        event, e.g. with rows from other workers. Runs until cancelled."""
+        self.wake = asyncio.Event()
+        while True:
+            try:
+                await asyncio.wait_for(self.wake.wait(), self.sync_every)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            if not self.subs: continue
+            before = self.seq
+            try:
+                snap = await asyncio.to_thread(snapshot)
+            except Exception as e:
+                logging.error(f"event sync failed: {e}")
+                continue
+            # local deltas published meanwhile may be newer than `snap`; the next round decides
+            if snap["seq"] != self.seq and self.seq == before:
+                self.seq = snap["seq"]
+                self.syncs += 1
+                self.publish("sync", dict(snap))
+
+    async def stream(self, sub: Subscriber):
+        """SSE body for one subscriber; heartbeats keep proxies from timing the stream out."""
+        try:
+            yield f"retry: 3000\n: connected {sub.since:.0f}\n\n".encode()
+            while not sub.dropped:
+                try:
+                    frame = await asyncio.wait_for(sub.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    frame = b": ping\n\n"
+                if sub.dropped: break
+                yield frame
+        finally:
+            self.unsubscribe(sub)
+
+    def stats(self) -> dict:
+        return {"subscribers": len(self.subs), "published": self.published, "slow_drops": self.slow_drops,
+                "syncs": self.syncs, "seq": self.seq, "max_queue": self.max_queue, "max_clients": self.max_clients}
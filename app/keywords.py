@@ -0,0 +1,51 @@
+import re
+from typing import Dict, FrozenSet, Iterable
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    # Prefix-factored alternation: sre walks it like a trie and, being greedy, returns the
+    # longest term starting at the match position.
+    trie: Dict[str, dict] = {}
+    for t in terms:
+        node = trie
+        for ch in t: node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        alts = [re.escape(ch) + build(sub) for ch, sub in sorted(node.items()) if ch]
+        if not alts: return ""
+        body = alts[0] if len(alts) == 1 else "(?:" + "|".join(alts) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class KeywordMatcher:
+    """Single-pass multi-keyword matcher with `term in text` semantics for every term.
+
+    The term trie is compiled into one regex. Each hit yields the longest term at that
+    position; every term contained in it is present too, and scanning resumes at the
+    first offset where a term could start inside the hit and run past its end
+    (the Aho-Corasick failure link), so overlapping terms are never missed.
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: FrozenSet[str] = frozenset(t for t in terms if t)
+        self._search = re.compile(_trie_pattern(self.terms)).search if self.terms else None
+        self._contained: Dict[str, FrozenSet[str]] = {t: frozenset(u for u in self.terms if u in t) for t in self.terms}
+        self._resume: Dict[str, int] = {
+            t: next((k for k in range(1, len(t))
+                     if any(len(u) > len(t) - k and u.startswith(t[k:]) for u in self.terms)), len(t))
+            for t in self.terms
+        }
+
+    def find(self, text: str) -> FrozenSet[str]:
+        """Return every term that occurs in `text`."""
+        if not text or self._search is None:
+            return frozenset()
+        found = set()
+        search, contained, resume = self._search, self._contained, self._resume
+        m = search(text)
+        while m:
+            t = m.group()
+            found |= contained[t]
+            m = search(text, m.start() + resume[t])
+        return frozenset(found)
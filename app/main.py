@@ -1,84 +1,94 @@
+import time
+STARTUP = {"import_started": time.perf_counter()}   # startup timing starts before the heavy imports
+
 from fastapi import FastAPI, Form, Request, Query
-from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse
+from fastapi.responses import HTMLResponse, StreamingResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 from fastapi.staticfiles import StaticFiles
 from fastapi.concurrency import run_in_threadpool
-from typing import Dict, Optional
+from typing import Optional
 from datetime import datetime
-import matplotlib
-matplotlib.use('Agg')
-import matplotlib.pyplot as plt
-import numpy as np
-import inspect, logging, io, os, re, json
-from io import BytesIO
+import asyncio, hashlib, logging, os, re, json
+
+from app.cache import LRUCache, etag_matches
+from app.metrics import ERRORS, REGISTRY, STAGE_SECONDS, MetricsMiddleware
+from app.radar import CTAS_LEVELS, FORMATS as RADAR_FORMATS, RenderBusy, RenderPool
+
+from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader
 
 app = FastAPI()
-templates = Jinja2Templates(directory="app/templates")
+app.add_middleware(MetricsMiddleware, skip=("/events",))    # per-route latency histograms for /metrics
+
+# slow-request profiling is off unless TRIAGE_PROFILE_MS is set (then requests slower than it keep their stacks)
+PROFILE_MS = float(os.environ.get("TRIAGE_PROFILE_MS", "0"))
+profiler = None
+if PROFILE_MS > 0:
+    from app.profiler import ProfilerMiddleware, SlowRequestProfiler
+    profiler = SlowRequestProfiler(PROFILE_MS, keep=int(os.environ.get("TRIAGE_PROFILE_KEEP", "20")),
+                                   interval_ms=float(os.environ.get("TRIAGE_PROFILE_INTERVAL_MS", "5")))
+    app.add_middleware(ProfilerMiddleware, profiler=profiler, skip=("/events", "/metrics"))
+# templates compile once per worker (bytecode cached on disk for restarts) and are not re-checked
+# for edits on every render unless TRIAGE_TEMPLATE_RELOAD=1 (development)
+templates = Jinja2Templates(env=Environment(
+    loader=FileSystemLoader("app/templates"), autoescape=True,
+    auto_reload=os.environ.get("TRIAGE_TEMPLATE_RELOAD", "0") == "1",
+    bytecode_cache=FileSystemBytecodeCache(os.environ.get("TRIAGE_TEMPLATE_CACHE") or None)))
 app.mount("/static", StaticFiles(directory="app/templates"), name="static")
 
 RECORDS_PATH = "app/records.json"
 FEEDBACK_PATH = "app/feedback.json"
 
-def save_line_json(path: str, obj: dict):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "a", encoding="utf-8") as f:
-        f.write(json.dumps(obj, ensure_ascii=False) + "\n")
-
-def load_lines_json(path: str):
-    out = []
-    if not os.path.exists(path):
-        return out
-    with open(path, "r", encoding="utf-8") as f:
-        for ln in f:
-            ln = ln.strip()
-            if ln:
-                try:
-                    out.append(json.loads(ln))
-                except:
-                    pass
-    return out
-
-def classify_vital_signs(vitals: Dict[str, float]) -> Dict[str, str]:
-    """Return Normal / Abnormal / OutOfRange / Missing for each vital."""
-    result = {}
-    ranges = {
-        "Systolic": {"valid": (60, 260), "normal": (90, 120)},
-        "Diastolic": {"valid": (30, 160), "normal": (60, 80)},
-        "TEMPERATURE": {"valid": (30.0, 43.0), "normal": (36.1, 37.8)},
-        "hr": {"valid": (30, 220), "normal": (60, 100)},
-        "RR": {"valid": (6, 35), "normal": (12, 20)},
-        "O2_Sat": {"valid": (50, 100), "normal": (95, 100)},
-        "GCS": {"valid": (3, 15), "normal": (15, 15)},
-        "blood_glucose": {"valid": (20, 600), "normal": (70, 140)},
-        "Pain_Scale": {"valid": (0, 10), "normal": (0, 3)},
-    }
-    for key, meta in ranges.items():
-        v = vitals.get(key)
-        if v in (None, ""):
-            result[key] = "Missing"
-            continue
-        vmin, vmax = meta["valid"]; nmin, nmax = meta["normal"]
-        try:
-            val = float(v)
-            if not (vmin <= val <= vmax):
-                result[key] = "OutOfRange"
-            elif nmin <= val <= nmax:
-                result[key] = "Normal"
-            else:
-                result[key] = "Abnormal"
-        except:
-            result[key] = "Missing"
-    return result
-
-def vitals_any_out_of_range(vital_classes: Dict[str, str]) -> bool:
-    return any(v == "OutOfRange" for v in vital_classes.values())
-
-# قواعدك
-from app.rules import determine_ctas
+DB_PATH = "app/triage.db"
+# sqlite (default) or jsonl for small installs
+STORAGE_BACKEND = os.environ.get("TRIAGE_STORAGE", "sqlite")
+
+from app.storage import make_storage, LEVELS
+# jsonl logs rotate into compressed segments past TRIAGE_ROTATE_MB (and daily with TRIAGE_ROTATE_DAILY=1)
+storage = make_storage(STORAGE_BACKEND, RECORDS_PATH, FEEDBACK_PATH, DB_PATH,
+                       rotate_bytes=int(float(os.environ.get("TRIAGE_ROTATE_MB", "64")) * 1024 * 1024),
+                       rotate_daily=os.environ.get("TRIAGE_ROTATE_DAILY", "0") == "1")
+
+from app.events import EventHub
+# live feed for display boards; a client more than TRIAGE_EVENT_QUEUE events behind is dropped, and
+# writes from other workers reach this worker's clients as a `sync` within TRIAGE_EVENT_SYNC seconds
+event_hub = EventHub(max_queue=int(os.environ.get("TRIAGE_EVENT_QUEUE", "256")),
+                     max_clients=int(os.environ.get("TRIAGE_EVENT_CLIENTS", "500")),
+                     sync_every=float(os.environ.get("TRIAGE_EVENT_SYNC", "1")))
+
+from app.writer import WriteQueue
+writer = WriteQueue(storage, on_written=lambda recs, fbs: event_hub.publish_batch(recs, fbs, storage.seq()))
+event_sync = None
+
+@app.on_event("startup")
+async def storage_startup():
+    global event_sync
+    await run_in_threadpool(storage.open)
+    writer.start()
+    event_sync = asyncio.get_running_loop().create_task(event_hub.follow(analytics))
+
+@app.on_event("shutdown")
+async def storage_shutdown():
+    event_sync.cancel()
+    await writer.stop()
+    storage.close()
+
+from app.triage import BatchReader, vitals_any_out_of_range, triage, triage_chunk, triage_memo
+from app.rules import CATALOG
 
 @app.get("/", response_class=HTMLResponse)
 async def home(request: Request):
-    return templates.TemplateResponse("index.html", {"request": request})
+    with STAGE_SECONDS.time("template_render"):
+        return templates.TemplateResponse("index.html", {"request": request})
+
+def response_mode(request: Request) -> str:
+    """"json" when JSON is asked for, "fragment" for fetch/htmx submits, else the full "page"."""
+    accept = request.headers.get("accept") or ""
+    if "application/json" in accept and "text/html" not in accept:
+        return "json"
+    if request.headers.get("hx-request") == "true" or \
+       (request.headers.get("x-requested-with") or "").lower() in ("fetch", "xmlhttprequest"):
+        return "fragment"
+    return "page"
 
 @app.post("/process", response_class=HTMLResponse)
 async def process_data(
@@ -111,41 +121,62 @@ async def process_data(
         "blood_glucose": blood_glucose, "blood_glucose_symptoms": blood_glucose_symptoms
     }
 
-    # dict مختصر للrules (بدون None) لتفادي مقارنات مع None
-    vitals_for_rules = {k: v for k, v in vitals_full.items() if v not in (None, "")}
-
-    vital_classes = classify_vital_signs(vitals_full)
+    vital_classes, ctas_level, reason, record = triage(vitals_full, chief_complaint, history, symptoms_bool, distress_level)
     form_error = "One or more inputs out of safe range — please review." if vitals_any_out_of_range(vital_classes) else None
 
-    # determine_ctas قد يعتمد على وجود/غياب المفاتيح
-    ctas_level, reason = determine_ctas(vitals_for_rules, chief_complaint or "", history or "", symptoms_bool, distress_level or "")
-
-    record = {
-        "timestamp": str(datetime.now()),
-        "vitals": vitals_full,
-        "symptoms_present": symptoms_bool,
-        "chief_complaint": chief_complaint or "",
-        "history": history or "",
-        "distress_level": distress_level or "",
-        "ctas_level": ctas_level,
-        "reason": reason
-    }
     try:
-        save_line_json(RECORDS_PATH, record)
+        writer.put_record(record)
     except Exception as e:
-        print("save_record error:", e)
-
-    return templates.TemplateResponse("index.html", {
-        "request": request, "ctas_level": ctas_level, "reason": reason,
-        "vital_classes": vital_classes, "form_error": form_error,
-        "systolic": systolic or "", "diastolic": diastolic or "", "temp": temp or "", "hr": hr or "", "rr": rr or "",
-        "o2_sat": o2_sat or "", "gcs": gcs or "", "blood_glucose": blood_glucose or "", "pain_scale": pain_scale or "",
-        "location_of_pain": location_of_pain or "", "pain_duration": pain_duration or "",
-        "symptoms_present": ("yes" if symptoms_bool else "no") if symptoms_present else "",
-        "distress_level": distress_level or "",
-        "blood_glucose_symptoms": blood_glucose_symptoms or "",
-        "chief_complaint": chief_complaint or "", "history": history or ""
-    })
+        ERRORS.inc("save_record")
+        logging.error(f"save_record error: {e}")
+
+    # the full page only for plain form posts; the page's own script submits with fetch and swaps in the fragment
+    mode = response_mode(request)
+    if mode == "json":
+        return JSONResponse({"ctas_level": ctas_level, "reason": reason, "vital_classes": vital_classes, "form_error": form_error})
+    with STAGE_SECONDS.time("template_render"):
+        return templates.TemplateResponse("_result.html" if mode == "fragment" else "index.html", {
+            "request": request, "ctas_level": ctas_level, "reason": reason,
+            "vital_classes": vital_classes, "form_error": form_error,
+            "systolic": systolic or "", "diastolic": diastolic or "", "temp": temp or "", "hr": hr or "", "rr": rr or "",
+            "o2_sat": o2_sat or "", "gcs": gcs or "", "blood_glucose": blood_glucose or "", "pain_scale": pain_scale or "",
+            "location_of_pain": location_of_pain or "", "pain_duration": pain_duration or "",
+            "symptoms_present": ("yes" if symptoms_bool else "no") if symptoms_present else "",
+            "distress_level": distress_level or "",
+            "blood_glucose_symptoms": blood_glucose_symptoms or "",
+            "chief_complaint": chief_complaint or "", "history": history or ""
+        })
+
+BATCH_CHUNK = 256       # patients triaged per threadpool call
+
+@app.post("/api/triage/batch")
+async def triage_batch(request: Request):
+    """Triage a JSON array or NDJSON body of patients; streams NDJSON results in input order.
+
+    The body is parsed in the threadpool as it arrives (malformed input is a 400 before
+    anything is sent), then triaged BATCH_CHUNK patients at a time there while the
+    results stream out, so a large batch never blocks the event loop.
+    """
+    reader = BatchReader("ndjson" in (request.headers.get("content-type") or "").lower())
+    patients = []
+    try:
+        async for data in request.stream():
+            patients += await run_in_threadpool(reader.feed, data)
+        patients += reader.feed(b"", final=True)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    async def results():
+        for start in range(0, len(patients), BATCH_CHUNK):
+            text, records = await run_in_threadpool(triage_chunk, start, patients[start:start + BATCH_CHUNK])
+            try:
+                writer.put_records(records)
+            except Exception as e:
+                ERRORS.inc("save_record")
+                logging.error(f"save_record error: {e}")
+            yield text
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
 
 @app.post("/save-feedback")
 async def save_feedback(request: Request):
@@ -158,190 +189,240 @@ async def save_feedback(request: Request):
             payload = dict(form)
 
         # fallback من آخر record
-        recs = load_lines_json(RECORDS_PATH)
-        last_rec = recs[-1] if recs else {}
+        last_rec = writer.last_record()
         payload.setdefault("timestamp", str(datetime.now()))
         payload.setdefault("ctas_level", last_rec.get("ctas_level"))
         payload.setdefault("chief_complaint", last_rec.get("chief_complaint"))
         payload.setdefault("history", last_rec.get("history"))
         payload.setdefault("reason", last_rec.get("reason"))
 
-        save_line_json(FEEDBACK_PATH, payload)
+        writer.put_feedback(payload)
         return {"ok": True, "saved": payload}
     except Exception as e:
+        ERRORS.inc("save_feedback")
         return JSONResponse({"error": f"Failed to save feedback: {e}"}, status_code=500)
 
-@app.get("/radar_chart")
-async def radar_chart(reason: str):
-    return await run_in_threadpool(generate_radar_chart, reason)
-
-def generate_radar_chart(reason: str):
-    try:
-        reason_list = [r.strip() for r in reason.split(",") if r.strip()]
-        ctas_levels = ['CTAS 1','CTAS 2','CTAS 3','CTAS 4','CTAS 5']
-        ctas_colors = {'CTAS 1':'#206CF9','CTAS 2':'#FF3B30','CTAS 3':'#FFD60A','CTAS 4':'#34C759','CTAS 5':'#E5E7EB'}
-        counts = {k:0 for k in ctas_levels}
-        for it in reason_list:
-            low = it.lower()
-            for lvl in ctas_levels:
-                if lvl.lower() in low: counts[lvl] += 1
-        total = sum(counts.values()) or 1
-        probs = [counts[k]/total for k in ctas_levels]
-
-        angles = np.linspace(0, 2*np.pi, len(ctas_levels), endpoint=False).tolist()
-        angles += angles[:1]; radii = probs + probs[:1]
-
-        fig, ax = plt.subplots(figsize=(8,8), subplot_kw=dict(polar=True))
-        bg = '#090e39'; ax.set_facecolor(bg); plt.gcf().set_facecolor(bg)
-        ax.set_theta_offset(np.pi/2); ax.set_theta_direction(-1); ax.set_ylim(0,1.0)
-        ax.set_rgrids([0.25,0.5,0.75,1.0], labels=['25%','50%','75%','100%'], angle=0, color='#8fbff0', alpha=0.9, fontsize=9)
-        ax.grid(color='#59d2fd', linestyle='--', linewidth=0.6, alpha=0.35)
-        ax.set_xticks(angles[:-1]); ax.set_xticklabels(ctas_levels, color='#59d2fd', fontsize=11)
-        ax.plot(angles, radii, linewidth=1.8, color='#59d2fd', alpha=0.9)
-        ax.fill(angles, radii, color='#59d2fd', alpha=0.25)
-        for i, lvl in enumerate(ctas_levels):
-            ax.scatter([angles[i]],[probs[i]], s=80, color=ctas_colors[lvl], zorder=5)
-            ax.text(angles[i], min(1.0, probs[i]+0.12), f"{counts[lvl]} • {probs[i]*100:.0f}%", color=ctas_colors[lvl],
-                    ha='center', va='center', fontsize=10, fontweight='bold')
-        ax.set_title('CTAS Probability Radar', color='#59d2fd', fontsize=15, pad=22)
-        buf = BytesIO(); plt.tight_layout(); plt.savefig(buf, format='png', dpi=300, bbox_inches='tight'); buf.seek(0); plt.close()
-        return StreamingResponse(buf, media_type='image/png')
-    except Exception as e:
-        logging.error(f"Radar error: {e}")
-        return JSONResponse({"error": str(e)}, status_code=500)
-
-@app.get("/graph_data")
-def graph_data(reason: str = Query(default=""), chief: str = Query(default=""), history: str = Query(default="")):
-    reasons = [r.strip() for r in reason.split(",") if r.strip()]
-    ctas_levels = [f"CTAS {i}" for i in range(1,6)]
+RADAR_VERSION = 2           # bump when the rendering changes so cached ETags are invalidated
+radar_cache = LRUCache(max_bytes=32 * 1024 * 1024)
+# chart rendering processes (0 = render in the threadpool) and how many renders may wait for one
+render_pool = RenderPool(workers=int(os.environ.get("TRIAGE_RENDER_WORKERS", "2")),
+                         max_queue=int(os.environ.get("TRIAGE_RENDER_QUEUE", "16")),
+                         warm_up=os.environ.get("TRIAGE_RADAR_WARMUP", "1") == "1")
+
+@app.on_event("startup")
+def render_startup():
+    render_pool.start()
+
+@app.on_event("shutdown")
+def render_shutdown():
+    render_pool.stop()
+
+def radar_counts(reason: str) -> tuple:
+    """Per-level hit counts over comma-separated reasons; the only input the radar depends on."""
+    reason_list = [r.strip() for r in reason.split(",") if r.strip()]
+    counts = {k:0 for k in CTAS_LEVELS}
+    for it in reason_list:
+        low = it.lower()
+        for lvl in CTAS_LEVELS:
+            if lvl.lower() in low: counts[lvl] += 1
+    return tuple(counts[k] for k in CTAS_LEVELS)
+
+def radar_etag(key: tuple) -> str:
+    return '"' + hashlib.sha1(f"radar:{RADAR_VERSION}:{key}".encode()).hexdigest() + '"'
 
+@app.get("/radar_chart")
+async def radar_chart(request: Request, reason: str, format: str = Query(default="png"), dpi: int = Query(default=300, ge=30, le=600)):
+    if format not in RADAR_FORMATS:
+        return JSONResponse({"error": f"format must be one of {sorted(RADAR_FORMATS)}"}, status_code=400)
+    counts = radar_counts(reason)
+    key = (counts, format, dpi if format == "png" else None)
+    etag = radar_etag(key)
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    img = radar_cache.get(key)
+    if img is None:
+        try:
+            img = await render_pool.render(counts, format, dpi)
+        except RenderBusy:
+            return JSONResponse({"error": "Chart renderer busy, retry shortly"}, status_code=503, headers={"Retry-After": "1"})
+        except Exception as e:
+            ERRORS.inc("radar_render")
+            logging.error(f"Radar error: {e}")
+            return JSONResponse({"error": str(e)}, status_code=500)
+        radar_cache.put(key, img)
+    return Response(img, media_type=RADAR_FORMATS[format], headers=headers)
+
+GRAPH_VERSION = 1
+graph_cache = LRUCache(max_bytes=8 * 1024 * 1024)
+LEVEL_IN_REASON = re.compile(r"ctas ([1-5])")
+
+def reason_level(txt: str) -> Optional[str]:
+    """Highest-acuity "CTAS n" mentioned in a reason, or None."""
+    found = LEVEL_IN_REASON.findall(txt.lower())
+    return f"CTAS {min(found)}" if found else None
+
+def build_graph(reasons, chief: str, history: str) -> dict:
     nodes = [{"id":"Patient","name":"Patient","group":"patient"}]
-    nodes += [{"id":lvl,"name":lvl,"group":"ctas"} for lvl in ctas_levels]
+    nodes += [{"id":lvl,"name":lvl,"group":"ctas"} for lvl in CTAS_LEVELS]
     if chief:   nodes.append({"id":"Chief", "name": f"Chief: {chief[:80]}", "group":"text"})
     if history: nodes.append({"id":"History", "name": f"History: {history[:80]}", "group":"text"})
 
     links = []
+    in_count = {}
     for i, txt in enumerate(reasons, start=1):
         rid = f"R{i}"
-        lvl_found = next((L for L in ctas_levels if L.lower() in txt.lower()), None)
+        lvl_found = reason_level(txt)
         nodes.append({"id":rid,"name":txt,"group":"rule"})
         links.append({"source":"Patient","target":rid,"value":1})
-        if lvl_found: links.append({"source":rid,"target":lvl_found,"value":2})
+        if lvl_found:
+            links.append({"source":rid,"target":lvl_found,"value":2})
+            in_count[lvl_found] = in_count.get(lvl_found,0)+1
     if chief:   links.append({"source":"Patient","target":"Chief","value":1})
     if history: links.append({"source":"Patient","target":"History","value":1})
-    present = [lvl for lvl in ctas_levels if any(lvl.lower() in it.lower() for it in reasons)]
-    if present: links.append({"source":"Patient","target":present[0],"value":3})
+    if in_count: links.append({"source":"Patient","target":min(in_count),"value":3})
 
-    in_count = {}
-    for l in links:
-        t = l["target"]["id"] if isinstance(l.get("target"), dict) else l.get("target")
-        s = l["source"]["id"] if isinstance(l.get("source"), dict) else l.get("source")
-        if str(t).startswith("CTAS") and s not in ("Patient","Chief","History"):
-            in_count[t] = in_count.get(t,0)+1
     for n in nodes: n["inCount"] = in_count.get(n["id"],0)
     return {"nodes": nodes, "links": links}
 
+@app.get("/graph_data")
+def graph_data(request: Request, reason: str = Query(default=""), chief: str = Query(default=""), history: str = Query(default="")):
+    key = hashlib.sha1(f"{GRAPH_VERSION}\0{reason}\0{chief}\0{history}".encode("utf-8", "surrogatepass")).hexdigest()
+    etag = f'"{key}"'
+    headers = {"ETag": etag, "Cache-Control": "public, max-age=86400"}
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    body = graph_cache.get(key)
+    if body is None:
+        reasons = [r.strip() for r in reason.split(",") if r.strip()]
+        body = json.dumps(build_graph(reasons, chief, history), ensure_ascii=False).encode("utf-8")
+        graph_cache.put(key, body)
+    return Response(body, media_type="application/json", headers=headers)
+
 @app.get("/analytics")
 def analytics():
-    recs = load_lines_json(RECORDS_PATH)
-    fbs  = load_lines_json(FEEDBACK_PATH)
-    samples = len(recs) or None
-    accepted = declined = 0
-    for fb in fbs:
-        d = (fb.get("decision") or fb.get("feedback_decision") or "").lower()
-        if d == "accept": accepted += 1
-        elif d == "decline": declined += 1
-    return {"accepted": accepted or None, "declined": declined or None, "samples": samples, "feedback": (len(fbs) or None)}
+    n = storage.counts()
+    return {"accepted": n["accepted"] or None, "declined": n["declined"] or None,
+            "samples": n["records"] or None, "feedback": (n["feedback"] or None), "seq": n["seq"]}
+
+@app.get("/cache_stats")
+def cache_stats():
+    return {"radar": radar_cache.stats(), "graph": graph_cache.stats(), "triage": triage_memo.stats()}
+
+# ---- Prometheus: existing *_stats counters, read at scrape time
+REGISTRY.collected("triage_cache_lookups_total", "Cache lookups by outcome.", "counter", ("cache", "outcome"),
+                   lambda: [((name, o), st[o]) for name, st in cache_stats().items() for o in ("hits", "misses")])
+REGISTRY.collected("triage_cache_size", "Cache size: bytes for size-bounded caches, entries otherwise.", "gauge", ("cache",),
+                   lambda: [((name,), st["bytes"] or st["entries"]) for name, st in cache_stats().items()])
+for _name, _kind, _help, _fn in (
+    ("triage_writer_queue_depth", "gauge", "Records/feedback waiting for the group commit.", lambda: writer.stats()["queue_depth"]),
+    ("triage_writer_written_total", "counter", "Records/feedback written by the queue.", lambda: writer.stats()["written"]),
+    ("triage_writer_dropped_total", "counter", "Records/feedback dropped after retries.", lambda: writer.stats()["dropped"]),
+    ("triage_render_in_flight", "gauge", "Radar renders running or queued.", lambda: render_pool.stats()["in_flight"]),
+    ("triage_render_rejected_total", "counter", "Radar renders refused with 503.", lambda: render_pool.stats()["rejected"]),
+    ("triage_event_subscribers", "gauge", "Connected /events clients.", lambda: event_hub.stats()["subscribers"]),
+    ("triage_event_slow_drops_total", "counter", "/events clients dropped for falling behind.", lambda: event_hub.stats()["slow_drops"]),
+    ("triage_stored_records", "gauge", "Records in storage.", lambda: storage.rec.count),
+    ("triage_stored_feedback", "gauge", "Feedback entries in storage.", lambda: storage.fb.count),
+):
+    REGISTRY.collected(_name, _help, _kind, fn=lambda f=_fn: [((), f())])
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text exposition: request/stage latency histograms, rule fire counts, errors, queues."""
+    return Response(REGISTRY.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/events")
+async def events():
+    """Server-sent events: `record` and `feedback` as they are written (`records` for bulk
+    batches), each with counter deltas, and `sync` with the /analytics counters when other
+    workers wrote. Every event carries the storage `seq` (see EventHub)."""
+    sub = event_hub.subscribe()
+    if sub is None:
+        return JSONResponse({"error": "Too many live subscribers"}, status_code=503, headers={"Retry-After": "5"})
+    return StreamingResponse(event_hub.stream(sub), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/event_stats")
+def event_stats():
+    return event_hub.stats()
+
+@app.get("/render_stats")
+def render_stats():
+    return render_pool.stats()
+
+@app.get("/writer_stats")
+def writer_stats():
+    return writer.stats()
+
+PROFILING_OFF = {"error": "Profiling is disabled; set TRIAGE_PROFILE_MS to a latency threshold in ms"}
+
+@app.get("/admin/profiles")
+def admin_profiles():
+    """Kept slow-request profiles, newest first (ids for /admin/profiles/{id})."""
+    if profiler is None:
+        return JSONResponse(PROFILING_OFF, status_code=404)
+    return {**profiler.stats(), "profiles": profiler.list()}
+
+@app.get("/admin/profiles/{profile_id}")
+def admin_profile(profile_id: str):
+    """Collapsed stacks for flamegraph.pl/speedscope; `all` merges every kept profile."""
+    if profiler is None:
+        return JSONResponse(PROFILING_OFF, status_code=404)
+    text = profiler.collapsed(None if profile_id == "all" else int(profile_id) if profile_id.isdigit() else -1)
+    if text is None:
+        return JSONResponse({"error": f"No kept profile {profile_id}"}, status_code=404)
+    return Response(text, media_type="text/plain; charset=utf-8")
 
 @app.get("/rules_meta")
 def rules_meta():
-    try:
-        import app.rules as rules_mod
-        src = inspect.getsource(rules_mod.determine_ctas)
-        nums = re.findall(r"rules\.append\(\(\s*([1-5])\s*,", src)
-        per = {"CTAS 1":0,"CTAS 2":0,"CTAS 3":0,"CTAS 4":0,"CTAS 5":0}
-        for n in nums: per[f"CTAS {n}"] += 1
-        return {"per_ctas": per, "total": sum(per.values())}
-    except Exception:
-        return {"per_ctas": None, "total": None}
+    return {"per_ctas": CATALOG.per_ctas, "total": CATALOG.total}
 
 @app.get("/rules_search")
 def rules_search(term: str = Query(default="")):
-    try:
-        import app.rules as rules_mod
-        src = inspect.getsource(rules_mod.determine_ctas)
-        patt = re.compile(r"rules\.append\(\(\s*([1-5])\s*,\s*([ru]?)?['\"](.+?)['\"]\s*\)\)", re.S)
-        items = []
-        for m in patt.finditer(src):
-            items.append({"ctas": int(m.group(1)), "desc": m.group(3).strip()})
-        if term:
-            t = term.lower()
-            items = [x for x in items if t in x["desc"].lower()]
-        items.sort(key=lambda x: (x["ctas"], x["desc"]))
-        return items
-    except Exception as e:
-        return JSONResponse({"error": str(e)}, status_code=500)
+    return CATALOG.search(term)
 
 # ---- Analytics for CTAS cards/modals
-@app.get("/analytics_by_ctas")
-def analytics_by_ctas():
-    recs = load_lines_json(RECORDS_PATH)
-    fbs  = load_lines_json(FEEDBACK_PATH)
-
-    totals = {f"CTAS {i}": 0 for i in range(1,6)}
-    records_by_ctas = {f"CTAS {i}": [] for i in range(1,6)}
-    for r in recs:
-        lvl = r.get("ctas_level")
-        if isinstance(lvl, str) and lvl.isdigit(): lvl = int(lvl)
-        if isinstance(lvl, int) and 1 <= lvl <= 5:
-            key = f"CTAS {lvl}"
-            totals[key] += 1
-            records_by_ctas[key].append({
-                "id": r.get("timestamp",""),
-                "ctas": key,
-                "chief": r.get("chief_complaint",""),
-                "history": r.get("history",""),
-                "timestamp": r.get("timestamp",""),
-                "source": "record"
-            })
-    for k,v in records_by_ctas.items():
-        v.sort(key=lambda x: x["timestamp"], reverse=True)
-        records_by_ctas[k] = v[:120]
-
-    acc = {f"CTAS {i}": 0 for i in range(1,6)}
-    rej = {f"CTAS {i}": 0 for i in range(1,6)}
-    cases_acc, cases_rej = [], []
-
-    for fb in fbs:
-        d = (fb.get("decision") or fb.get("feedback_decision") or "").lower()
-        lvl = fb.get("ctas_level")
-        if isinstance(lvl, str) and lvl.isdigit(): lvl = int(lvl)
-        if not (isinstance(lvl, int) and 1 <= lvl <= 5):
-            m = re.search(r"ctas\s*([1-5])", (fb.get("reason") or fb.get("reasons") or ""), re.I)
-            if m: lvl = int(m.group(1))
-        if not (isinstance(lvl, int) and 1 <= lvl <= 5): continue
-
-        key = f"CTAS {lvl}"
-        obj = {
-            "id": fb.get("id") or fb.get("timestamp") or "",
-            "ctas": key,
-            "chief": fb.get("chief_complaint") or fb.get("chief") or "",
-            "history": fb.get("history") or "",
-            "timestamp": fb.get("timestamp") or "",
-            "source": "feedback"
-        }
-        if d == "accept": acc[key] += 1; cases_acc.append(obj)
-        elif d == "decline": rej[key] += 1; cases_rej.append(obj)
+analytics_snapshot = {"version": None, "etag": "", "body": b""}   # rebuilt only when the storage view changes
+
+def build_analytics_by_ctas() -> dict:
+    totals = storage.ctas_totals()
+    acc, rej = storage.feedback_by_ctas()
+    cases = storage.feedback_cases()
 
     accepted = {k: {"count": acc[k],
                     "conf": int(round((acc[k] / totals[k] * 100), 0)) if totals[k] else None}
-                for k in totals.keys()}
-    rejected = {k: {"count": rej[k]} for k in totals.keys()}
+                for k in LEVELS}
+    rejected = {k: {"count": rej[k]} for k in LEVELS}
 
     return {
         "accepted": accepted,
         "rejected": rejected,
         "totals": totals,
-        "cases": {"accepted": cases_acc, "rejected": cases_rej},
-        "records": records_by_ctas
+        "cases": {"accepted": cases["accept"], "rejected": cases["decline"]},
+        "records": storage.recent_records()
     }
+
+@app.get("/analytics_by_ctas")
+def analytics_by_ctas(request: Request):
+    global analytics_snapshot
+    version, snap = storage.version(), analytics_snapshot
+    if snap["version"] != version:
+        body = json.dumps(build_analytics_by_ctas(), ensure_ascii=False).encode("utf-8")
+        snap = analytics_snapshot = {"version": version, "etag": f'"{hashlib.sha1(body).hexdigest()}"', "body": body}
+    headers = {"ETag": snap["etag"], "Cache-Control": "no-cache"}
+    if etag_matches(request.headers.get("if-none-match"), snap["etag"]):
+        return Response(status_code=304, headers=headers)
+    return Response(snap["body"], media_type="application/json", headers=headers)
+
+# ---- Startup timing (registered last, so it runs after the other startup hooks)
+STARTUP["import_seconds"] = time.perf_counter() - STARTUP["import_started"]
+
+@app.on_event("startup")
+def startup_ready():
+    STARTUP["ready_seconds"] = time.perf_counter() - STARTUP["import_started"]
+    logging.info(f"Ready in {STARTUP['ready_seconds'] * 1000:.0f} ms (imports {STARTUP['import_seconds'] * 1000:.0f} ms)")
+
+REGISTRY.collected("triage_startup_seconds", "Worker startup: module imports, and imports through the startup hooks.",
+                   "gauge", ("phase",),
+                   lambda: [(("import",), STARTUP["import_seconds"]), (("ready",), STARTUP.get("ready_seconds"))])
@@ -0,0 +1,166 @@
+"""In-process counters and latency histograms, exposed in Prometheus text format.
+
+Metrics are plain objects on a registry: observe()/inc() are a dict lookup and a few
+integer adds under a lock, so they stay on in production; formatting only happens when
+/metrics is scraped. Values are per process (each uvicorn worker reports its own).
+"""
+import bisect, threading, time
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (.0005, .001, .0025, .005, .01, .025, .05, .1, .25, .5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(v) -> str:
+    return str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _labels(names: Sequence[str], values: Sequence, extra: str = "") -> str:
+    parts = [f'{k}="{_escape(v)}"' for k, v in zip(names, values)]
+    if extra: parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _num(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+class Counter:
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.values: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, *labels, n: float = 1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + n
+
+    def inc_all(self, label_sets: Iterable[tuple]):
+        """inc() for several label sets under one lock acquisition."""
+        with self.lock:
+            for labels in label_sets:
+                self.values[labels] = self.values.get(labels, 0) + 1
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted(self.values.items())
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"] + \
+               [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in items]
+
+class Timer:
+    __slots__ = ("hist", "labels", "start")
+
+    def __init__(self, hist: "Histogram", labels: tuple):
+        self.hist, self.labels = hist, labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.hist.observe(time.perf_counter() - self.start, *self.labels)
+
+class Histogram:
+    """Cumulative-bucket histogram per label set (seconds unless the name says otherwise)."""
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name, self.help, self.labels = name, help, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.series: Dict[tuple, list] = {}     # labels -> [per-bucket counts (+Inf last), sum, count]
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, *labels):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            s = self.series.get(labels)
+            if s is None:
+                s = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            s[0][i] += 1
+            s[1] += value
+            s[2] += 1
+
+    def time(self, *labels) -> Timer:
+        return Timer(self, labels)
+
+    def render(self) -> List[str]:
+        with self.lock:
+            items = sorted((k, (list(s[0]), s[1], s[2])) for k, s in self.series.items())
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for k, (counts, total, n) in items:
+            acc = 0
+            for le, c in zip((*map(_num, self.buckets), "+Inf"), counts):
+                acc += c
+                bound = f'le="{le}"'
+                out.append(f"{self.name}_bucket{_labels(self.labels, k, bound)} {acc}")
+            out.append(f"{self.name}_sum{_labels(self.labels, k)} {_num(total)}")
+            out.append(f"{self.name}_count{_labels(self.labels, k)} {n}")
+        return out
+
+class Collected:
+    """Values read from existing stats at scrape time; fn() -> [(label values, value), ...]."""
+
+    def __init__(self, name: str, help: str, kind: str, labels: Sequence[str], fn: Callable[[], Iterable[Tuple[tuple, float]]]):
+        self.name, self.help, self.kind, self.labels, self.fn = name, help, kind, tuple(labels), fn
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + \
+               [f"{self.name}{_labels(self.labels, k)} {_num(v)}" for k, v in self.fn() if v is not None]
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, object] = {}
+
+    def _add(self, m):
+        if m.name in self.metrics:
+            raise ValueError(f"metric {m.name} already registered")
+        self.metrics[m.name] = m
+        return m
+
+    def counter(self, name: str, help: str, labels: Sequence[str] = ()) -> Counter:
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def collected(self, name: str, help: str, kind: str = "gauge", labels: Sequence[str] = (), fn=None) -> Collected:
+        return self._add(Collected(name, help, kind, labels, fn))
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self.metrics.values():
+            try:
+                lines += m.render()
+            except Exception as e:      # one broken collector must not take the endpoint down
+                lines.append(f"# {m.name} unavailable: {_escape(e)}")
+        return "\n".join(lines) + "\n"
+
+REGISTRY = Registry()
+HTTP_SECONDS = REGISTRY.histogram("triage_http_request_duration_seconds", "Request latency by route template.",
+                                  ("method", "route", "status"))
+STAGE_SECONDS = REGISTRY.histogram("triage_stage_duration_seconds",
+                                   "Time spent in one step of a request (vitals, rules, template, storage, radar).", ("stage",))
+ERRORS = REGISTRY.counter("triage_errors_total", "Errors caught and logged instead of raised.", ("where",))
+
+class MetricsMiddleware:
+    """ASGI middleware timing every request into HTTP_SECONDS.
+
+    The route label is the matched path template (/radar_chart, not its query), static
+    mounts use their prefix and anything unrouted is "unmatched", so label values stay
+    bounded. Paths in `skip` (long-lived streams) are not timed.
+    """
+
+    def __init__(self, app, skip: Sequence[str] = ()):
+        self.app, self.skip = app, frozenset(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            route = scope.get("route")
+            name = getattr(route, "path", None) or ((scope.get("root_path") or "unmatched") if "endpoint" in scope else "unmatched")
+            HTTP_SECONDS.observe(time.perf_counter() - start, scope["method"], name, status[0])
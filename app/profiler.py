@@ -0,0 +1,122 @@
+"""Opt-in sampling profiler for slow requests.
+
+While at least one request is in flight, a background thread samples the stacks of every
+busy thread every `interval_ms` (sys._current_frames) and adds them to each in-flight
+request. Requests that end up slower than `threshold_ms` keep their samples in a ring of
+the last `keep` profiles, readable as collapsed stacks (`frame;frame;frame count`, the
+input of flamegraph.pl and speedscope). Overlapping requests share samples, so under
+concurrency a profile also shows what its neighbours were doing.
+
+Disabled means not installed: main.py only adds the middleware when TRIAGE_PROFILE_MS is
+set, so requests pay nothing otherwise.
+"""
+import os, sys, threading, time
+from collections import Counter, deque
+from typing import Dict, List, Optional
+
+# A thread whose innermost frame is in one of these is parked, not working.
+IDLE_FILES = ("selectors.py", "threading.py", "queue.py", os.path.join("concurrent", "futures", "thread.py"))
+
+def frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+def collapse(frame, max_depth: int = 96) -> Optional[str]:
+    """Root-to-leaf `a;b;c` for one thread's stack, or None if it is idle."""
+    if frame.f_code.co_filename.endswith(IDLE_FILES):
+        return None
+    names = []
+    while frame is not None and len(names) < max_depth:
+        names.append(frame_name(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+class SlowRequestProfiler:
+    def __init__(self, threshold_ms: float, keep: int = 20, interval_ms: float = 5.0):
+        self.threshold_ms, self.interval = threshold_ms, interval_ms / 1000
+        self.profiles: deque = deque(maxlen=keep)
+        self.active: Dict[int, Counter] = {}
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+        self.seq = self.requests = self.samples = 0
+
+    def begin(self) -> Counter:
+        stacks = Counter()
+        with self.lock:
+            self.active[id(stacks)] = stacks
+            self.requests += 1
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name="slow-request-sampler", daemon=True)
+                self.thread.start()
+        self.wake.set()
+        return stacks
+
+    def end(self, stacks: Counter, seconds: float, info: dict):
+        with self.lock:
+            self.active.pop(id(stacks), None)
+            if seconds * 1000 < self.threshold_ms: return
+            self.seq += 1
+            self.profiles.append({"id": self.seq, "at": time.time(), "ms": round(seconds * 1000, 2), **info,
+                                  "samples": sum(stacks.values()), "stacks": stacks})
+
+    def _run(self):
+        me = threading.get_ident()
+        while True:
+            if not self.active:
+                self.wake.clear()
+                if not self.active: self.wake.wait()
+                continue
+            names = {t.ident: t.name for t in threading.enumerate()}
+            found = []
+            for tid, frame in sys._current_frames().items():
+                if tid == me: continue
+                stack = collapse(frame)
+                if stack is not None: found.append(f"{names.get(tid, tid)};{stack}")
+            with self.lock:
+                for stacks in self.active.values():
+                    stacks.update(found)
+                self.samples += 1
+            time.sleep(self.interval)
+
+    def list(self) -> List[dict]:
+        """Newest first, without the stacks."""
+        with self.lock:
+            return [{k: v for k, v in p.items() if k != "stacks"} for p in reversed(self.profiles)]
+
+    def collapsed(self, profile_id: Optional[int] = None) -> Optional[str]:
+        """Collapsed stacks of one profile, or of all kept profiles merged when profile_id is None."""
+        with self.lock:
+            chosen = [p for p in self.profiles if profile_id is None or p["id"] == profile_id]
+            if not chosen and profile_id is not None: return None
+            total = Counter()
+            for p in chosen: total.update(p["stacks"])
+        return "".join(f"{stack} {n}\n" for stack, n in sorted(total.items()))
+
+    def stats(self) -> dict:
+        return {"threshold_ms": self.threshold_ms, "interval_ms": self.interval * 1000, "keep": self.profiles.maxlen,
+                "kept": len(self.profiles), "requests": self.requests, "sample_ticks": self.samples}
+
+class ProfilerMiddleware:
+    """ASGI middleware feeding SlowRequestProfiler; paths in `skip` are not profiled."""
+
+    def __init__(self, app, profiler: SlowRequestProfiler, skip=()):
+        self.app, self.profiler, self.skip = app, profiler, frozenset(skip)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] in self.skip:
+            return await self.app(scope, receive, send)
+        status = [500]
+
+        async def send_status(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        stacks = self.profiler.begin()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            self.profiler.end(stacks, time.perf_counter() - start,
+                              {"method": scope["method"], "path": scope["path"], "query": scope.get("query_string", b"").decode("latin-1")[:200],
+                               "route": getattr(scope.get("route"), "path", None), "status": status[0]})
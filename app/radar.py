@@ -0,0 +1,141 @@
+import logging, math, threading
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+
+from app.metrics import STAGE_SECONDS
+
+CTAS_LEVELS = ['CTAS 1','CTAS 2','CTAS 3','CTAS 4','CTAS 5']
+CTAS_COLORS = {'CTAS 1':'#206CF9','CTAS 2':'#FF3B30','CTAS 3':'#FFD60A','CTAS 4':'#34C759','CTAS 5':'#E5E7EB'}
+FORMATS = {"png": "image/png", "svg": "image/svg+xml"}
+BG = '#090e39'
+ANGLES = [2*math.pi*i/len(CTAS_LEVELS) for i in range(len(CTAS_LEVELS))]
+
+class RadarTemplate:
+    """A radar figure whose static parts (axes, grid, ticks, title) are built once.
+
+    Uses the object-oriented Figure API with its own Agg canvas, so no pyplot global
+    state is involved; render() only moves the data polygon, markers and labels.
+    Not thread-safe by itself: use one template per thread (see render_radar).
+    matplotlib is imported here, on first render, not when the app starts.
+    """
+
+    def __init__(self):
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+        self.fig = Figure(figsize=(8,8), facecolor=BG)
+        FigureCanvasAgg(self.fig)
+        ax = self.fig.add_subplot(projection="polar")
+        ax.set_facecolor(BG)
+        ax.set_theta_offset(math.pi/2); ax.set_theta_direction(-1); ax.set_ylim(0,1.0)
+        ax.set_rgrids([0.25,0.5,0.75,1.0], labels=['25%','50%','75%','100%'], angle=0, color='#8fbff0', alpha=0.9, fontsize=9)
+        ax.grid(color='#59d2fd', linestyle='--', linewidth=0.6, alpha=0.35)
+        ax.set_xticks(ANGLES); ax.set_xticklabels(CTAS_LEVELS, color='#59d2fd', fontsize=11)
+        ax.set_title('CTAS Probability Radar', color='#59d2fd', fontsize=15, pad=22)
+        closed = ANGLES + ANGLES[:1]
+        zeros = [0.0] * len(closed)
+        self.line, = ax.plot(closed, zeros, linewidth=1.8, color='#59d2fd', alpha=0.9)
+        self.area, = ax.fill(closed, zeros, color='#59d2fd', alpha=0.25)
+        self.dots = [ax.scatter([a], [0.0], s=80, color=CTAS_COLORS[lvl], zorder=5) for a, lvl in zip(ANGLES, CTAS_LEVELS)]
+        self.labels = [ax.text(a, 0.12, "", color=CTAS_COLORS[lvl], ha='center', va='center', fontsize=10, fontweight='bold')
+                       for a, lvl in zip(ANGLES, CTAS_LEVELS)]
+        self.fig.tight_layout()
+
+    def render(self, counts: tuple, fmt: str = "png", dpi: int = 300) -> bytes:
+        total = sum(counts) or 1
+        probs = [c/total for c in counts]
+        closed = ANGLES + ANGLES[:1]
+        radii = probs + probs[:1]
+        self.line.set_data(closed, radii)
+        self.area.set_xy(list(zip(closed, radii)))
+        for a, p, n, dot, label in zip(ANGLES, probs, counts, self.dots, self.labels):
+            dot.set_offsets([[a, p]])
+            label.set_position((a, min(1.0, p+0.12)))
+            label.set_text(f"{n} • {p*100:.0f}%")
+        buf = BytesIO()
+        self.fig.savefig(buf, format=fmt, dpi=dpi, bbox_inches='tight')
+        return buf.getvalue()
+
+_local = threading.local()
+
+def render_radar(counts: tuple, fmt: str = "png", dpi: int = 300) -> bytes:
+    """Render with this thread's template (built on first use)."""
+    tpl = getattr(_local, "template", None)
+    if tpl is None:
+        tpl = _local.template = RadarTemplate()
+    return tpl.render(tuple(counts), fmt, dpi)
+
+class RenderBusy(Exception):
+    """Raised when the render queue is full; callers should answer 503."""
+
+def _warm_worker():
+    render_radar((1, 0, 0, 0, 0), "png", 30)
+
+def _import_plotting():
+    import matplotlib.backends.backend_agg, matplotlib.figure
+
+class RenderPool:
+    """Bounded process pool for radar rendering.
+
+    Rendering is CPU-bound and holds the GIL, so it runs in separate processes that
+    import matplotlib and build their figure template once at startup. At most
+    `workers + max_queue` renders are in flight; beyond that render() raises RenderBusy.
+    With workers=0 (or before start()) renders fall back to the caller's thread pool.
+    Nothing here imports matplotlib in the server process up front; with `warm_up` the
+    workers (or, with workers=0, a background thread) load it right after start() so
+    the first chart does not pay for it, without delaying startup.
+    """
+
+    def __init__(self, workers: int = 2, max_queue: int = 16, warm_up: bool = True):
+        self.workers, self.max_queue, self.warm_up = workers, max_queue, warm_up
+        self.pool = None
+        self.in_flight = 0
+        self.rendered = self.rejected = 0
+
+    def start(self):
+        if self.workers <= 0:
+            if self.warm_up:
+                threading.Thread(target=_import_plotting, name="radar-warm-up", daemon=True).start()
+            return
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"),
+                                        initializer=_warm_worker if self.warm_up else None)
+        for _ in range(self.workers):   # spawn every worker now instead of on first request
+            self.pool.submit(int)
+
+    def stop(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=True, cancel_futures=True)
+            self.pool = None
+
+    async def render(self, counts: tuple, fmt: str = "png", dpi: int = 300) -> bytes:
+        import asyncio
+        from fastapi.concurrency import run_in_threadpool
+        limit = (self.workers or 1) + self.max_queue
+        if self.in_flight >= limit:
+            self.rejected += 1
+            raise RenderBusy()
+        self.in_flight += 1
+        try:
+            with STAGE_SECONDS.time("radar_render"):      # pool wait + render, as the request sees it
+                if self.pool is None:
+                    img = await run_in_threadpool(render_radar, counts, fmt, dpi)
+                else:
+                    pool = self.pool
+                    try:
+                        img = await asyncio.get_running_loop().run_in_executor(pool, render_radar, counts, fmt, dpi)
+                    except BrokenProcessPool:
+                        # a worker died (OOM, killed); replace the pool so later requests recover
+                        if self.pool is pool:
+                            logging.error("Render pool broken; restarting workers")
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            self.start()
+                        raise
+            self.rendered += 1
+            return img
+        finally:
+            self.in_flight -= 1
+
+    def stats(self) -> dict:
+        return {"workers": self.workers if self.pool is not None else 0, "in_flight": self.in_flight,
+                "max_in_flight": (self.workers or 1) + self.max_queue, "rendered": self.rendered, "rejected": self.rejected}
@@ -0,0 +1,203 @@
+"""Bulk re-triage of historical visits.
+
+    python -m app.retriage visits.csv -o scored.jsonl --workers 8
+    python -m app.retriage visits.parquet -o scored.parquet --resume
+
+Input rows use the /process form field names (systolic, hr, temp, chief_complaint, ...)
+and go through the same classify_vital_signs + determine_ctas path as the web app. The
+input is streamed in chunks that fan out over a process pool; results are written in
+input order as JSONL, CSV or a directory of Parquet parts, and a checkpoint after every
+chunk lets an interrupted run continue with --resume.
+"""
+import argparse, csv, glob, itertools, json, os, sys, time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple
+
+from app.triage import VITAL_FIELDS, triage_json
+
+OUTPUT_FORMATS = ("jsonl", "csv", "parquet")
+RESULT_COLUMNS = ("index", "id", "ctas_level", "reason", "out_of_range") + tuple(f"class_{k}" for k in VITAL_FIELDS)
+
+def need_pyarrow():
+    try:
+        import pyarrow, pyarrow.parquet
+    except ImportError:
+        raise SystemExit("Parquet input/output needs pyarrow (pip install pyarrow)")
+    return pyarrow
+
+# ---------- Input ----------
+def iter_rows(path: str, skip: int = 0) -> Iterator[dict]:
+    """Input rows as dicts, streamed; the first `skip` rows are passed over."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".parquet":
+        pa = need_pyarrow()
+        for batch in pa.parquet.ParquetFile(path).iter_batches(batch_size=4096):
+            if skip >= batch.num_rows:
+                skip -= batch.num_rows      # whole batch already done; never converted
+                continue
+            yield from batch.slice(skip).to_pylist()
+            skip = 0
+        return
+    with open(path, "r", newline="", encoding="utf-8-sig") as f:
+        rows = (json.loads(ln) for ln in f if ln.strip()) if ext in (".jsonl", ".ndjson") else csv.DictReader(f)
+        yield from itertools.islice(rows, skip, None)
+
+def read_chunks(path: str, chunk_size: int, skip: int = 0) -> Iterator[Tuple[int, List[dict]]]:
+    """(index of the first row, rows) per chunk; at most one chunk is held here at a time."""
+    rows, start = iter_rows(path, skip), skip
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield start, chunk
+        start += len(chunk)
+
+# ---------- Scoring (runs in the workers) ----------
+def score_chunk(start: int, rows: List[dict], id_column: str) -> List[dict]:
+    out = []
+    for i, row in enumerate(rows, start):
+        if id_column != "id" and id_column in row:
+            row = {**row, "id": row[id_column]}
+        res, _ = triage_json(i, row)
+        out.append(res)
+    return out
+
+def flat(res: dict) -> dict:
+    """One result as a flat row for CSV/Parquet."""
+    row = {"index": res["index"], "id": None if res.get("id") is None else str(res["id"]),
+           "ctas_level": res.get("ctas_level"), "reason": res.get("reason") or [],
+           "out_of_range": res.get("out_of_range")}
+    for k in VITAL_FIELDS:
+        row[f"class_{k}"] = (res.get("vital_classes") or {}).get(k)
+    return row
+
+# ---------- Output ----------
+# Each writer resumes from `position` (bytes for jsonl/csv, part files for parquet), which
+# is what the checkpoint recorded after the last fully written chunk.
+class JsonlOut:
+    def __init__(self, path: str, position: int = 0):
+        self.f = open(path, "r+b" if position else "wb")
+        self.f.truncate(position); self.f.seek(0, os.SEEK_END)
+
+    def write(self, results: List[dict]):
+        self.f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results).encode("utf-8"))
+
+    def sync(self) -> int:
+        self.f.flush(); os.fsync(self.f.fileno())
+        return os.fstat(self.f.fileno()).st_size
+
+    def close(self):
+        self.f.close()
+
+class CsvOut(JsonlOut):
+    def __init__(self, path: str, position: int = 0):
+        self.f = open(path, "r+" if position else "w", newline="", encoding="utf-8")
+        self.f.truncate(position); self.f.seek(0, os.SEEK_END)
+        self.w = csv.DictWriter(self.f, fieldnames=RESULT_COLUMNS)
+        if not position: self.w.writeheader()
+
+    def write(self, results):
+        self.w.writerows({**r, "reason": " | ".join(r["reason"])} for r in map(flat, results))
+
+class ParquetOut:
+    def __init__(self, path: str, position: int = 0):
+        self.pa = need_pyarrow()
+        self.path, self.parts = path, position
+        os.makedirs(path, exist_ok=True)
+        for p in glob.glob(os.path.join(glob.escape(path), "part-*.parquet")):
+            if int(os.path.basename(p)[5:11]) >= position: os.remove(p)     # written after the checkpoint
+        pa = self.pa
+        self.schema = pa.schema([("index", pa.int64()), ("id", pa.string()), ("ctas_level", pa.int64()),
+                                 ("reason", pa.list_(pa.string())), ("out_of_range", pa.bool_())]
+                                + [(f"class_{k}", pa.string()) for k in VITAL_FIELDS])
+
+    def write(self, results):
+        table = self.pa.Table.from_pylist([flat(r) for r in results], schema=self.schema)
+        self.pa.parquet.write_table(table, os.path.join(self.path, f"part-{self.parts:06d}.parquet"))
+        self.parts += 1
+
+    def sync(self) -> int:
+        return self.parts
+
+    def close(self): pass
+
+WRITERS = {"jsonl": JsonlOut, "csv": CsvOut, "parquet": ParquetOut}
+
+# ---------- Checkpoint ----------
+def input_identity(path: str) -> dict:
+    st = os.stat(path)
+    return {"input": os.path.abspath(path), "size": st.st_size, "mtime": st.st_mtime}
+
+def load_checkpoint(path: str, expect: dict) -> dict:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            ck = json.load(f)
+    except FileNotFoundError:
+        return {"rows": 0, "position": 0}
+    if {k: ck.get(k) for k in expect} != expect:
+        raise SystemExit(f"{path} belongs to a different input/output; delete it or run without --resume")
+    return ck
+
+def save_checkpoint(path: str, ck: dict):
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(ck, f)
+    os.replace(tmp, path)
+
+# ---------- Driver ----------
+def run(args) -> dict:
+    fmt = args.format or ("csv" if args.output.endswith(".csv") else "parquet" if args.output.endswith(".parquet") else "jsonl")
+    ck_path = args.checkpoint or args.output + ".ckpt"
+    ident = {**input_identity(args.input), "output": os.path.abspath(args.output), "format": fmt}
+    ck = load_checkpoint(ck_path, ident) if args.resume else {"rows": 0, "position": 0}
+    out = WRITERS[fmt](args.output, ck["position"])
+    chunks = read_chunks(args.input, args.chunk_size, ck["rows"])
+    done, t0, last = 0, time.perf_counter(), 0.0
+
+    def emit(results: List[dict]):
+        nonlocal done, last
+        out.write(results)
+        done += len(results)
+        save_checkpoint(ck_path, {**ident, "rows": ck["rows"] + done, "position": out.sync()})
+        now = time.perf_counter() - t0
+        if now - last >= args.progress_every:
+            last = now
+            print(f"{ck['rows'] + done} rows  {done / now:,.0f} rows/s", file=sys.stderr)
+
+    try:
+        if args.workers == 0:
+            for start, rows in chunks:
+                emit(score_chunk(start, rows, args.id_column))
+        else:
+            with ProcessPoolExecutor(args.workers) as pool:
+                pending = deque()       # bounded: reading never runs more than 2 chunks/worker ahead
+                for start, rows in chunks:
+                    pending.append(pool.submit(score_chunk, start, rows, args.id_column))
+                    if len(pending) >= 2 * args.workers:
+                        emit(pending.popleft().result())
+                while pending:
+                    emit(pending.popleft().result())
+    finally:
+        out.close()
+    secs = time.perf_counter() - t0
+    summary = {"rows": done, "resumed_from": ck["rows"], "seconds": round(secs, 3),
+               "rows_per_sec": round(done / secs, 1) if secs else None, "output": args.output, "format": fmt}
+    print(json.dumps(summary), file=sys.stderr)
+    return summary
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m app.retriage", description="Re-triage historical visits in bulk.")
+    ap.add_argument("input", help="CSV, Parquet or JSONL file with /process form field names")
+    ap.add_argument("-o", "--output", required=True, help="results file (.jsonl/.csv) or Parquet directory")
+    ap.add_argument("--format", choices=OUTPUT_FORMATS, help="default: from the output extension, else jsonl")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (0 = score in this process)")
+    ap.add_argument("--chunk-size", type=int, default=5000)
+    ap.add_argument("--id-column", default="id", help="input column copied to each result as `id`")
+    ap.add_argument("--checkpoint", help="default: <output>.ckpt")
+    ap.add_argument("--resume", action="store_true", help="continue after the last checkpointed chunk")
+    ap.add_argument("--progress-every", type=float, default=5.0, help="seconds between rows/sec reports")
+    run(ap.parse_args(argv))
+
+if __name__ == "__main__":
+    main()
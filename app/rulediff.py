@@ -0,0 +1,260 @@
+"""Replay a corpus through two versions of the rule module and report what changes.
+
+    python -m app.rulediff git:HEAD app/rules.py
+    python -m app.rulediff /tmp/rules_before.py app/rules.py --corpus visits.csv --workers 8 --json
+
+A version is a path to a rules module or `git:<rev>` (app/rules.py at that revision,
+run with that revision's app/keywords.py). The corpus is the stored records of the
+configured backend (TRIAGE_STORAGE: app/triage.db, or app/records.json with its rotated
+segments) unless --corpus names a JSONL/CSV/Parquet of stored records or
+/process-style rows. Each chunk is parsed once into columns that both
+versions evaluate (determine_ctas_batch where the module has it, determine_ctas
+otherwise); chunks fan out over a process pool. The report has the old -> new level
+confusion matrix, per-rule firing count deltas and sample changed cases.
+"""
+import argparse, importlib.util, itertools, json, os, subprocess, sys, tempfile, time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List
+
+import numpy as np
+
+from app.retriage import iter_rows
+from app.rules import NUMERIC_FIELDS, num
+from app.storage import iter_log_lines, make_storage
+from app.triage import form_inputs
+
+TEXT_FIELDS = ("Location_of_Pain", "Pain_Duration", "blood_glucose_symptoms")
+LEVEL_LABELS = [f"CTAS {i}" for i in range(1, 6)]
+RECORDS_PATH, FEEDBACK_PATH, DB_PATH = "app/records.json", "app/feedback.json", "app/triage.db"
+
+# ---------- Rule versions ----------
+def resolve_version(version: str, tmpdir: str) -> tuple:
+    """(rules module path, keywords module path or None); `git:<rev>` writes both out from
+    the repository, a plain path runs with the working tree's app.keywords."""
+    if not version.startswith("git:"):
+        return version, None
+    rev = version[len("git:"):]
+    try:
+        src = subprocess.run(["git", "show", f"{rev}:app/rules.py"], capture_output=True, check=True).stdout
+    except subprocess.CalledProcessError as e:
+        raise SystemExit(f"git show {rev}:app/rules.py failed: {e.stderr.decode().strip()}")
+    kw = subprocess.run(["git", "show", f"{rev}:app/keywords.py"], capture_output=True)   # older revisions have none
+    base = os.path.join(tmpdir, f"rules_{rev.replace('/', '_').replace('~', '_').replace('^', '_')}")
+    with open(base + ".py", "wb") as f:
+        f.write(src)
+    if kw.returncode:
+        return base + ".py", None
+    with open(base + "_keywords.py", "wb") as f:
+        f.write(kw.stdout)
+    return base + ".py", base + "_keywords.py"
+
+def load_module(path: str, name: str):
+    spec = importlib.util.spec_from_file_location(name, path)
+    if spec is None:
+        raise SystemExit(f"Cannot load {path}")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def load_rules(version: tuple, name: str):
+    """The rules module of a resolve_version() result; its `from app.keywords import ...`
+    gets the matching keywords module while it is imported."""
+    path, keywords = version
+    saved = sys.modules.get("app.keywords")
+    if keywords:
+        sys.modules["app.keywords"] = load_module(keywords, f"{name}_keywords")
+    try:
+        mod = load_module(path, name)
+    finally:
+        if keywords:
+            if saved is None: del sys.modules["app.keywords"]
+            else: sys.modules["app.keywords"] = saved
+    if not hasattr(mod, "determine_ctas"):
+        raise SystemExit(f"{path} has no determine_ctas")
+    return mod
+
+VERSIONS: Dict[str, object] = {}
+
+def init_versions(old: tuple, new: tuple):
+    VERSIONS["old"] = load_rules(old, "rules_old")
+    VERSIONS["new"] = load_rules(new, "rules_new")
+
+# ---------- Corpus ----------
+def corpus_inputs(row: dict) -> tuple:
+    """A stored record (has "vitals") or a /process-style row -> triage() arguments."""
+    if isinstance(row.get("vitals"), dict):
+        return (row["vitals"], row.get("chief_complaint"), row.get("history"),
+                bool(row.get("symptoms_present")), row.get("distress_level"))
+    return form_inputs(row)
+
+def stored_lines(backend: str):
+    """Record JSON lines from the configured storage, read without opening the live view."""
+    path = DB_PATH if backend == "sqlite" else RECORDS_PATH
+    if not os.path.exists(path):
+        raise SystemExit(f"No {backend} storage at {path}; pass --corpus or --backend")
+    return make_storage(backend, RECORDS_PATH, FEEDBACK_PATH, DB_PATH).record_lines()
+
+def read_chunks(path: str, chunk_size: int, backend: str = "sqlite"):
+    """(first row number, "jsonl" raw lines | "rows" dicts) per chunk; JSON is parsed in the workers.
+    Without a path, the stored records of `backend` are read."""
+    ext = os.path.splitext(path or "")[1].lower()
+    if not path:
+        kind, items = "jsonl", stored_lines(backend)
+    elif ext in (".csv", ".parquet"):
+        kind, items = "rows", iter_rows(path)
+    else:
+        if not os.path.exists(path):
+            raise SystemExit(f"Corpus {path} not found")
+        kind, items = "jsonl", iter_log_lines(path)
+    start = 0
+    while True:
+        chunk = list(itertools.islice(items, chunk_size))
+        if not chunk:
+            return
+        yield start, kind, chunk
+        start += len(chunk)
+
+class Batch:
+    """One chunk parsed once into the columns both rule versions evaluate."""
+
+    def __init__(self, rows: List[dict]):
+        self.inputs = [corpus_inputs(r) for r in rows]
+        vit = [x[0] for x in self.inputs]
+        self.vitals = {k: np.array([num(v.get(k)) for v in vit], dtype=float) for k in NUMERIC_FIELDS}
+        for k in TEXT_FIELDS:
+            self.vitals[k] = [v.get(k) or "" for v in vit]
+        self.chief = [x[1] or "" for x in self.inputs]
+        self.hist = [x[2] or "" for x in self.inputs]
+        self.symptoms = [x[3] for x in self.inputs]
+        self.distress = [x[4] or "" for x in self.inputs]
+        self.duration = np.array([d.lower() for d in self.vitals["Pain_Duration"]], dtype=object)
+
+def evaluate(mod, b: Batch):
+    """(levels, firing counts keyed by reason text, reasons(i)) for one rule version."""
+    if hasattr(mod, "determine_ctas_batch"):
+        levels, bits = mod.determine_ctas_batch(b.vitals, b.chief, b.hist, b.symptoms, b.distress)
+        fired = np.unpackbits(bits, axis=1, bitorder="little")[:, :len(mod.RULES)].astype(bool)
+        counts: Counter = Counter()
+        for j, r in enumerate(mod.RULES):
+            col = fired[:, j]
+            if not col.any(): continue
+            if "{duration}" in r.desc:
+                for d, c in Counter(b.duration[col]).items(): counts[r.desc.format(duration=d)] += c
+            else:
+                counts[r.desc] += int(col.sum())
+        none = int((~fired.any(axis=1)).sum())
+        if none: counts[mod.FALLBACK[1]] += none
+        pain = b.vitals["Pain_Duration"]
+        return levels.astype(int), counts, lambda i: mod.batch_reasons(bits[i], pain[i])
+    results = [mod.determine_ctas({k: v for k, v in vit.items() if v not in (None, "")}, c or "", h or "", s, d or "")
+               for vit, c, h, s, d in b.inputs]
+    return (np.array([r[0] for r in results], dtype=int), Counter(x for r in results for x in r[1]),
+            lambda i: results[i][1])
+
+def diff_chunk(start: int, kind: str, chunk: list, samples: int) -> dict:
+    rows, where, bad = [], [], 0
+    for i, item in enumerate(chunk):
+        if kind == "jsonl":
+            if not item.strip(): continue
+            try:
+                item = json.loads(item)
+            except ValueError:
+                item = None
+        if isinstance(item, dict):
+            rows.append(item); where.append(start + i)
+        else:
+            bad += 1
+    out = {"rows": len(rows), "unparsed": bad, "confusion": [[0] * 5 for _ in range(5)],
+           "old": Counter(), "new": Counter(), "changed": 0, "samples": []}
+    if not rows:
+        return out
+    b = Batch(rows)
+    lo, co, ro = evaluate(VERSIONS["old"], b)
+    ln, cn, rn = evaluate(VERSIONS["new"], b)
+    conf = np.zeros((5, 5), dtype=np.int64)
+    np.add.at(conf, (lo - 1, ln - 1), 1)
+    changed = np.flatnonzero(lo != ln)
+    out.update(confusion=conf.tolist(), old=co, new=cn, changed=int(len(changed)), samples=[
+        {"row": where[i], "chief_complaint": b.chief[i], "history": b.hist[i],
+         "old": {"ctas_level": int(lo[i]), "reason": list(ro(i))}, "new": {"ctas_level": int(ln[i]), "reason": list(rn(i))}}
+        for i in changed[:samples]])
+    return out
+
+# ---------- Driver ----------
+def run(args) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        old, new = resolve_version(args.old, tmp), resolve_version(args.new, tmp)
+        init_versions(old, new)      # fail fast, and used directly when --workers 0
+        total = {"rows": 0, "unparsed": 0, "changed": 0}
+        conf = np.zeros((5, 5), dtype=np.int64)
+        fired = {"old": Counter(), "new": Counter()}
+        samples: List[dict] = []
+        t0 = time.perf_counter()
+
+        def merge(res: dict):
+            for k in total: total[k] += res[k]
+            np.add(conf, res["confusion"], out=conf)
+            fired["old"].update(res["old"]); fired["new"].update(res["new"])
+            samples.extend(res["samples"][:args.samples - len(samples)])
+
+        chunks = read_chunks(args.corpus, args.chunk_size, args.backend)
+        if args.workers == 0:
+            for start, kind, chunk in chunks:
+                merge(diff_chunk(start, kind, chunk, args.samples))
+        else:
+            with ProcessPoolExecutor(args.workers, initializer=init_versions, initargs=(old, new)) as pool:
+                pending = deque()
+                for start, kind, chunk in chunks:
+                    pending.append(pool.submit(diff_chunk, start, kind, chunk, args.samples))
+                    if len(pending) >= 2 * args.workers:
+                        merge(pending.popleft().result())
+                while pending:
+                    merge(pending.popleft().result())
+    secs = time.perf_counter() - t0
+    rules = [{"rule": r, "old": fired["old"][r], "new": fired["new"][r], "delta": fired["new"][r] - fired["old"][r]}
+             for r in set(fired["old"]) | set(fired["new"])]
+    rules = sorted((r for r in rules if r["delta"] or args.all_rules), key=lambda r: (-abs(r["delta"]), r["rule"]))
+    return {"old": args.old, "new": args.new, "corpus": args.corpus or f"{args.backend} storage", **total,
+            "changed_pct": round(100 * total["changed"] / total["rows"], 3) if total["rows"] else None,
+            "confusion": {"rows": "old", "cols": "new", "labels": LEVEL_LABELS, "matrix": conf.tolist()},
+            "rules": rules, "samples": samples,
+            "seconds": round(secs, 3), "rows_per_sec": round(total["rows"] / secs, 1) if secs else None}
+
+def print_report(rep: dict, out=sys.stdout):
+    p = lambda *a: print(*a, file=out)
+    p(f"{rep['rows']} rows ({rep['unparsed']} unparsed) in {rep['seconds']}s, {rep['rows_per_sec']} rows/s")
+    p(f"level changed: {rep['changed']} ({rep['changed_pct']}%)\n")
+    p("old \\ new " + "".join(f"{l:>10}" for l in LEVEL_LABELS))
+    for label, row in zip(LEVEL_LABELS, rep["confusion"]["matrix"]):
+        p(f"{label:<10}" + "".join(f"{n:>10}" for n in row))
+    p("\nrule firing deltas (old -> new):" if rep["rules"] else "\nno rule firing changes")
+    for r in rep["rules"]:
+        p(f"{r['delta']:+10d}  {r['old']:>8} -> {r['new']:<8} {r['rule']}")
+    for s in rep["samples"]:
+        p(f"\nrow {s['row']}: CTAS {s['old']['ctas_level']} -> CTAS {s['new']['ctas_level']}  "
+          f"chief={s['chief_complaint'][:60]!r} history={s['history'][:60]!r}")
+        p("  old: " + " | ".join(s["old"]["reason"]))
+        p("  new: " + " | ".join(s["new"]["reason"]))
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m app.rulediff", description="Compare two rule versions over a corpus.")
+    ap.add_argument("old", help="rules module path or git:<rev>")
+    ap.add_argument("new", help="rules module path or git:<rev>")
+    ap.add_argument("--corpus", help="records.json / JSONL / CSV / Parquet (default: the stored records)")
+    ap.add_argument("--backend", choices=("sqlite", "jsonl"), default=os.environ.get("TRIAGE_STORAGE", "sqlite"),
+                    help="storage read without --corpus (TRIAGE_STORAGE)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="processes (0 = this process)")
+    ap.add_argument("--chunk-size", type=int, default=20000)
+    ap.add_argument("--samples", type=int, default=20, help="changed cases to include")
+    ap.add_argument("--all-rules", action="store_true", help="list unchanged rules too")
+    ap.add_argument("--json", action="store_true", help="print the report as JSON")
+    args = ap.parse_args(argv)
+    rep = run(args)
+    if args.json:
+        print(json.dumps(rep, ensure_ascii=False, indent=2))
+    else:
+        print_report(rep)
+
+if __name__ == "__main__":
+    main()
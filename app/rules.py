@@ -1,276 +1,418 @@
-from typing import Any, Dict, List, Tuple
+import hashlib, re
+from typing import Any, Callable, Dict, FrozenSet, List, NamedTuple, Sequence, Tuple
 
-def determine_ctas(
-    vitals: Dict[str, Any],
-    chief_complaint: str,
-    history: str,
-    symptoms_present: bool,
-    distress_level: str
-) -> Tuple[int, List[str]]:
-    # helpers
-    def num(x):
-        try:
-            if x is None or x == "": return None
-            return float(x)
-        except:
-            return None
-
-    def between(v, a, b): return v is not None and a <= v <= b
-    def lt(v, a):        return v is not None and v <  a
-    def lte(v, a):       return v is not None and v <= a
-    def gt(v, a):        return v is not None and v >  a
-    def gte(v, a):       return v is not None and v >= a
+from app.keywords import KeywordMatcher
 
-    chief = (chief_complaint or "").lower()
-    hist  = (history or "").lower()
+# Numeric inputs (parsed with num(), None when missing) vs. free/categorical inputs.
+NUMERIC_FIELDS = ("Systolic", "Diastolic", "GCS", "O2_Sat", "RR", "TEMPERATURE", "hr", "Pain_Scale", "blood_glucose")
 
-    systolic   = num(vitals.get("Systolic"))
-    diastolic  = num(vitals.get("Diastolic"))
-    gcs        = num(vitals.get("GCS"))
-    o2_sat     = num(vitals.get("O2_Sat"))
-    rr         = num(vitals.get("RR"))
-    temp       = num(vitals.get("TEMPERATURE"))
-    hr         = num(vitals.get("hr"))
-    pain_scale = num(vitals.get("Pain_Scale"))
-    location_of_pain = (vitals.get("Location_of_Pain") or "")
-    pain_duration    = (vitals.get("Pain_Duration") or "")
-    blood_glucose    = num(vitals.get("blood_glucose"))
-    blood_glucose_symptoms = (vitals.get("blood_glucose_symptoms") or "")
-
-    rules: List[Tuple[int,str]] = []
+def num(x):
+    try:
+        if x is None or x == "": return None
+        return float(x)
+    except:
+        return None
 
-    # ---------- CTAS 1 ----------
-    if "cardiac arrest" in chief:
-        rules.append((1, "Cardiac Arrest is a life-threatening condition requiring immediate resuscitation. (CTAS 1)"))
+def between(v, a, b): return v is not None and a <= v <= b
+def lt(v, a):        return v is not None and v <  a
+def lte(v, a):       return v is not None and v <= a
+def gt(v, a):        return v is not None and v >  a
+def gte(v, a):       return v is not None and v >= a
+
+# Atom operators: (field, op, *args). Missing numerics (None) never satisfy a comparison.
+OPS: Dict[str, Callable[..., bool]] = {
+    "<":      lt,
+    "<=":     lte,
+    ">":      gt,
+    ">=":     gte,
+    "[]":     between,
+    "[)":     lambda v, a, b: v is not None and a <= v < b,
+    "==":     lambda v, a: v == a,
+    "!=":     lambda v, a: v != a,
+    "in":     lambda v, a: v in a,
+    "not in": lambda v, a: v not in a,
+    "true":   lambda v: bool(v),
+    "false":  lambda v: not v,
+}
 
-    if "respiratory arrest" in chief:
-        rules.append((1, "Respiratory Arrest requires immediate aggressive interventions. (CTAS 1)"))
+class Rule(NamedTuple):
+    """One CTAS rule. Keyword fields match lowered substrings; `when` is AND of OR-groups of atoms."""
+    level: int
+    desc: str                                    # may contain {duration} (lowered Pain_Duration)
+    chief: Tuple[str, ...] = ()                  # all must appear in chief complaint
+    chief_any: Tuple[Tuple[str, ...], ...] = ()  # each group: at least one in chief complaint
+    chief_none: Tuple[str, ...] = ()             # none may appear in chief complaint
+    hist_any: Tuple[str, ...] = ()               # at least one must appear in history
+    when: Tuple[Any, ...] = ()                   # atoms or tuples of atoms (OR-groups)
 
-    if "major trauma" in chief and "shock" in chief:
-        rules.append((1, "Major trauma with shock requires immediate intervention—assigning CTAS 1."))
+R = Rule
+SYMPTOMATIC_LOW  = ("Confusion", "Diaphoresis", "Behavioural Change", "Seizure", "Acute Focal Deficits")
+SYMPTOMATIC_HIGH = ("Dyspnea", "Dehydration", "Tachypnea", "Thirst", "Polyuria", "Weakness")
+HIGH_BP    = (("Systolic", ">", 220), ("Diastolic", ">", 130))
+ELEVATED_BP = (("Systolic", "[]", 200, 220), ("Diastolic", "[]", 110, 130))
+FEVER = ("TEMPERATURE", ">=", 38)
 
-    if "shortness of breath" in chief and ("severe" in chief or "respiratory distress" in chief):
-        rules.append((1, "Severe shortness of breath/respiratory distress—CTAS 1."))
+def _pain(level_acute: int, level_other: int, grade: str, where: str, lo: float, hi: float) -> List[Rule]:
+    base = (("Pain_Scale", "[]", lo, hi), ("Location_of_Pain", "==", where))
+    return [
+        R(level_acute, f"{grade} {where.lower()} acute pain—CTAS {level_acute}.", when=base + (("Pain_Duration", "==", "Acute"),)),
+        R(level_other, f"{grade} {where.lower()} {{duration}} pain—CTAS {level_other}.", when=base + (("Pain_Duration", "!=", "Acute"),)),
+    ]
 
+RULES: List[Rule] = [
+    # ---------- CTAS 1 ----------
+    R(1, "Cardiac Arrest is a life-threatening condition requiring immediate resuscitation. (CTAS 1)", chief=("cardiac arrest",)),
+    R(1, "Respiratory Arrest requires immediate aggressive interventions. (CTAS 1)", chief=("respiratory arrest",)),
+    R(1, "Major trauma with shock requires immediate intervention—assigning CTAS 1.", chief=("major trauma", "shock")),
+    R(1, "Severe shortness of breath/respiratory distress—CTAS 1.", chief=("shortness of breath",), chief_any=(("severe", "respiratory distress"),)),
     # Shock bundle (guarded)
-    if (
-        "shock" in chief and
-        (between(hr,130,180) or lte(hr,50)) and
-        (between(systolic,200,220) or between(diastolic,110,130)) and
-        lt(gcs,15) and
-        (lt(temp,35) or gt(temp,38))
-    ):
-        rules.append((1, "Severe end-organ hypoperfusion pattern—CTAS 1."))
+    R(1, "Severe end-organ hypoperfusion pattern—CTAS 1.", chief=("shock",), when=(
+        (("hr", "[]", 130, 180), ("hr", "<=", 50)), ELEVATED_BP, ("GCS", "<", 15),
+        (("TEMPERATURE", "<", 35), ("TEMPERATURE", ">", 38)))),
 
     # ---------- Hemodynamic compromise ----------
-    if ("hemodynamic compromise" in chief and gt(hr,100) and ((systolic is not None and systolic < 90) or (diastolic is not None and diastolic < 60)) and gte(gcs,15)):
-        rules.append((2, "Evidence of hemodynamic compromise—CTAS 2."))
+    R(2, "Evidence of hemodynamic compromise—CTAS 2.", chief=("hemodynamic compromise",), when=(
+        ("hr", ">", 100), (("Systolic", "<", 90), ("Diastolic", "<", 60)), ("GCS", ">=", 15))),
 
     # ---------- Blood pressure + symptoms ----------
-    if ((gt(systolic,220) or gt(diastolic,130)) and symptoms_present):
-        rules.append((2, "SBP > 220 or DBP > 130 with symptoms—CTAS 2."))
-    if ((gt(systolic,220) or gt(diastolic,130)) and not symptoms_present):
-        rules.append((3, "SBP > 220 or DBP > 130 without symptoms—CTAS 3."))
-    if ((between(systolic,200,220) or between(diastolic,110,130)) and symptoms_present):
-        rules.append((3, "SBP 200–220 / DBP 110–130 with symptoms—CTAS 3."))
-    if ((between(systolic,200,220) or between(diastolic,110,130)) and not symptoms_present):
-        rules.append((4, "SBP 200–220 / DBP 110–130 without symptoms—CTAS 4."))
+    R(2, "SBP > 220 or DBP > 130 with symptoms—CTAS 2.", when=(HIGH_BP, ("symptoms_present", "true"))),
+    R(3, "SBP > 220 or DBP > 130 without symptoms—CTAS 3.", when=(HIGH_BP, ("symptoms_present", "false"))),
+    R(3, "SBP 200–220 / DBP 110–130 with symptoms—CTAS 3.", when=(ELEVATED_BP, ("symptoms_present", "true"))),
+    R(4, "SBP 200–220 / DBP 110–130 without symptoms—CTAS 4.", when=(ELEVATED_BP, ("symptoms_present", "false"))),
 
     # ---------- Distress + O2 ----------
-    if (distress_level == "Severe") or lt(o2_sat,90):
-        rules.append((1, "Severe distress or O2 < 90%—CTAS 1."))
-    if (distress_level == "Moderate") or (o2_sat is not None and 90 <= o2_sat < 92):
-        rules.append((2, "Moderate distress or O2 90–92%—CTAS 2."))
-    if (distress_level == "Mild") and (o2_sat is not None and 92 <= o2_sat <= 94):
-        rules.append((3, "Mild distress with O2 92–94%—CTAS 3."))
-    if (distress_level == "None") and gt(o2_sat,94):
-        rules.append((5, "No distress and O2 > 94%—CTAS 5."))
+    R(1, "Severe distress or O2 < 90%—CTAS 1.", when=((("distress_level", "==", "Severe"), ("O2_Sat", "<", 90)),)),
+    R(2, "Moderate distress or O2 90–92%—CTAS 2.", when=((("distress_level", "==", "Moderate"), ("O2_Sat", "[)", 90, 92)),)),
+    R(3, "Mild distress with O2 92–94%—CTAS 3.", when=(("distress_level", "==", "Mild"), ("O2_Sat", "[]", 92, 94))),
+    R(5, "No distress and O2 > 94%—CTAS 5.", when=(("distress_level", "==", "None"), ("O2_Sat", ">", 94))),
 
     # ---------- GCS ----------
-    if between(gcs,3,9):
-        rules.append((1, "Unconscious (GCS 3–9) / seizure—CTAS 1."))
-    if between(gcs,10,13):
-        rules.append((2, "Altered LOC (GCS 10–13)—CTAS 2."))
-    if gcs == 14:
-        rules.append((4, "Confusion (GCS 14)—CTAS 4 (context)."))
-    if gcs == 15:
-        rules.append((5, "Normal GCS (15)—CTAS 5 (context)."))
+    R(1, "Unconscious (GCS 3–9) / seizure—CTAS 1.", when=(("GCS", "[]", 3, 9),)),
+    R(2, "Altered LOC (GCS 10–13)—CTAS 2.", when=(("GCS", "[]", 10, 13),)),
+    R(4, "Confusion (GCS 14)—CTAS 4 (context).", when=(("GCS", "==", 14),)),
+    R(5, "Normal GCS (15)—CTAS 5 (context).", when=(("GCS", "==", 15),)),
 
     # ---------- Temperature ----------
-    if gte(temp,38):
-        if "immunocompromised" in chief:
-            rules.append((2, "Immunocompromised with fever—CTAS 2."))
-        elif "septic" in chief:
-            rules.append((2, "Looks septic (fever + SIRS)—CTAS 2."))
-        elif "unwell" in chief:
-            rules.append((3, "Looks unwell (fever)—CTAS 3."))
-        elif "well" in chief:
-            rules.append((4, "Looks well (isolated fever)—CTAS 4."))
-    if lt(temp,35):
-        rules.append((2, "Hypothermia < 35°C—CTAS 2."))
+    R(2, "Immunocompromised with fever—CTAS 2.", chief=("immunocompromised",), when=(FEVER,)),
+    R(2, "Looks septic (fever + SIRS)—CTAS 2.", chief=("septic",), chief_none=("immunocompromised",), when=(FEVER,)),
+    R(3, "Looks unwell (fever)—CTAS 3.", chief=("unwell",), chief_none=("immunocompromised", "septic"), when=(FEVER,)),
+    R(4, "Looks well (isolated fever)—CTAS 4.", chief=("well",), chief_none=("immunocompromised", "septic", "unwell"), when=(FEVER,)),
+    R(2, "Hypothermia < 35°C—CTAS 2.", when=(("TEMPERATURE", "<", 35),)),
 
     # ---------- Pain ----------
-    if pain_scale is not None:
-        if between(pain_scale,8,10):
-            if location_of_pain == "Central":
-                rules.append((2 if pain_duration == "Acute" else 3,
-                              f"Severe central {(pain_duration or '').lower()} pain—CTAS {'2' if pain_duration=='Acute' else '3'}."))
-            elif location_of_pain == "Peripheral":
-                rules.append((3 if pain_duration == "Acute" else 4,
-                              f"Severe peripheral {(pain_duration or '').lower()} pain—CTAS {'3' if pain_duration=='Acute' else '4'}."))
-        elif between(pain_scale,4,7):
-            if location_of_pain == "Central":
-                rules.append((3 if pain_duration == "Acute" else 4,
-                              f"Moderate central {(pain_duration or '').lower()} pain—CTAS {'3' if pain_duration=='Acute' else '4'}."))
-            elif location_of_pain == "Peripheral":
-                rules.append((4 if pain_duration == "Acute" else 5,
-                              f"Moderate peripheral {(pain_duration or '').lower()} pain—CTAS {'4' if pain_duration=='Acute' else '5'}."))
-        elif between(pain_scale,1,3):
-            if location_of_pain == "Central":
-                rules.append((4 if pain_duration == "Acute" else 5,
-                              f"Mild central {(pain_duration or '').lower()} pain—CTAS {'4' if pain_duration=='Acute' else '5'}."))
-            elif location_of_pain == "Peripheral":
-                rules.append((5, "Mild peripheral pain—CTAS 5."))
-        elif pain_scale == 0:
-            rules.append((5, "No pain—CTAS 5."))
+    *_pain(2, 3, "Severe", "Central", 8, 10),
+    *_pain(3, 4, "Severe", "Peripheral", 8, 10),
+    *_pain(3, 4, "Moderate", "Central", 4, 7),
+    *_pain(4, 5, "Moderate", "Peripheral", 4, 7),
+    *_pain(4, 5, "Mild", "Central", 1, 3),
+    R(5, "Mild peripheral pain—CTAS 5.", when=(("Pain_Scale", "[]", 1, 3), ("Location_of_Pain", "==", "Peripheral"))),
+    R(5, "No pain—CTAS 5.", when=(("Pain_Scale", "==", 0),)),
 
     # ---------- Glucose ----------
-    if lt(blood_glucose,50):
-        if blood_glucose_symptoms in ["Confusion","Diaphoresis","Behavioural Change","Seizure","Acute Focal Deficits"]:
-            rules.append((2, "Hypoglycemia <50 with symptoms—CTAS 2."))
-        else:
-            rules.append((3, "Hypoglycemia <50 without symptoms—CTAS 3."))
-    elif gt(blood_glucose,300):
-        if blood_glucose_symptoms in ["Dyspnea","Dehydration","Tachypnea","Thirst","Polyuria","Weakness"]:
-            rules.append((2, "Hyperglycemia >300 with symptoms—CTAS 2."))
-        else:
-            rules.append((3, "Hyperglycemia >300 without symptoms—CTAS 3."))
+    R(2, "Hypoglycemia <50 with symptoms—CTAS 2.", when=(("blood_glucose", "<", 50), ("blood_glucose_symptoms", "in", SYMPTOMATIC_LOW))),
+    R(3, "Hypoglycemia <50 without symptoms—CTAS 3.", when=(("blood_glucose", "<", 50), ("blood_glucose_symptoms", "not in", SYMPTOMATIC_LOW))),
+    R(2, "Hyperglycemia >300 with symptoms—CTAS 2.", when=(("blood_glucose", ">", 300), ("blood_glucose_symptoms", "in", SYMPTOMATIC_HIGH))),
+    R(3, "Hyperglycemia >300 without symptoms—CTAS 3.", when=(("blood_glucose", ">", 300), ("blood_glucose_symptoms", "not in", SYMPTOMATIC_HIGH))),
 
     # ---------- CTAS 2 examples ----------
-    if "shortness of breath" in chief and ("moderate" in chief or "respiratory distress" in chief):
-        rules.append((2, "Moderate SOB/respiratory distress—CTAS 2."))
-    if "chest pain" in chief and (("radiating" in hist) or ("sweating" in hist) or ("cardiac" in hist)):
-        rules.append((2, "Chest pain with radiating/sweating/cardiac features—CTAS 2."))
-    if "abdominal pain" in chief and (pain_scale is not None and pain_scale >= 8):
-        rules.append((2, "Abdominal pain with high severity—CTAS 2."))
-    if "headache" in chief and (pain_scale is not None and pain_scale >= 8):
-        rules.append((2, "Severe headache, consider serious causes—CTAS 2."))
-    if "major trauma" in chief:
-        rules.append((2, "Major trauma (no shock) example—CTAS 2."))
+    R(2, "Moderate SOB/respiratory distress—CTAS 2.", chief=("shortness of breath",), chief_any=(("moderate", "respiratory distress"),)),
+    R(2, "Chest pain with radiating/sweating/cardiac features—CTAS 2.", chief=("chest pain",), hist_any=("radiating", "sweating", "cardiac")),
+    R(2, "Abdominal pain with high severity—CTAS 2.", chief=("abdominal pain",), when=(("Pain_Scale", ">=", 8),)),
+    R(2, "Severe headache, consider serious causes—CTAS 2.", chief=("headache",), when=(("Pain_Scale", ">=", 8),)),
+    R(2, "Major trauma (no shock) example—CTAS 2.", chief=("major trauma",)),
 
     # ---------- CTAS 3 ----------
-    if "abdominal pain" in chief and (pain_scale is not None and 4 <= pain_scale <= 7):
-        rules.append((3, "Abdominal pain (4–7/10)—CTAS 3."))
-    if "headache" in chief and (pain_scale is not None and 4 <= pain_scale <= 7):
-        rules.append((3, "Headache (4–7/10)—CTAS 3."))
-    if "bloody diarrhea" in chief:
-        rules.append((3, "Diarrhea (uncontrolled bloody)—CTAS 3."))
+    R(3, "Abdominal pain (4–7/10)—CTAS 3.", chief=("abdominal pain",), when=(("Pain_Scale", "[]", 4, 7),)),
+    R(3, "Headache (4–7/10)—CTAS 3.", chief=("headache",), when=(("Pain_Scale", "[]", 4, 7),)),
+    R(3, "Diarrhea (uncontrolled bloody)—CTAS 3.", chief=("bloody diarrhea",)),
 
     # ---------- CTAS 4 ----------
-    if "confusion" in chief and gte(gcs,14):
-        rules.append((4, "Chronic confusion baseline—CTAS 4."))
-    if "constipation" in chief and (pain_scale is not None and 4 <= pain_scale <= 10):
-        rules.append((4, "Constipation (mild/mod pain)—CTAS 4."))
+    R(4, "Chronic confusion baseline—CTAS 4.", chief=("confusion",), when=(("GCS", ">=", 14),)),
+    R(4, "Constipation (mild/mod pain)—CTAS 4.", chief=("constipation",), when=(("Pain_Scale", "[]", 4, 10),)),
 
     # ---------- CTAS 5 ----------
-    if "medication refill" in chief or "medication request" in chief:
-        rules.append((5, "Medication refill/request—CTAS 5."))
-    if "dressing change" in chief:
-        rules.append((5, "Dressing change (uncomplicated)—CTAS 5."))
-    if "bite" in chief and (pain_scale is not None and 1 <= pain_scale <= 3):
-        rules.append((5, "Minor bite + mild pain—CTAS 5."))
-    if "diarrhea" in chief and "bloody" not in chief:
-        rules.append((5, "Diarrhea (mild, no dehydration)—CTAS 5."))
+    R(5, "Medication refill/request—CTAS 5.", chief_any=(("medication refill", "medication request"),)),
+    R(5, "Dressing change (uncomplicated)—CTAS 5.", chief=("dressing change",)),
+    R(5, "Minor bite + mild pain—CTAS 5.", chief=("bite",), when=(("Pain_Scale", "[]", 1, 3),)),
+    R(5, "Diarrhea (mild, no dehydration)—CTAS 5.", chief=("diarrhea",), chief_none=("bloody",)),
 
     # ---------- Bleeding ----------
-    if "bleeding" in chief and ("head" in chief or "neck" in chief):
-        rules.append((2, "Bleeding from head/neck—CTAS 2."))
-    if "bleeding" in chief and any(s in chief for s in ["chest","abdomen","pelvis","spine"]):
-        rules.append((2, "Bleeding chest/abdomen/pelvis/spine—CTAS 2."))
-    if "bleeding" in chief and "vaginal" in chief:
-        rules.append((2, "Massive vaginal hemorrhage—CTAS 2."))
-    if "bleeding" in chief and any(s in chief for s in ["iliopsoas","hip"]):
-        rules.append((2, "Bleeding iliopsoas/hip—CTAS 2."))
-    if "bleeding" in chief and "extremity muscle compartments" in chief:
-        rules.append((2, "Bleeding extremity compartments—CTAS 2."))
-    if "bleeding" in chief and any(s in chief for s in ["fractures","dislocations"]):
-        rules.append((2, "Bleeding with fractures/dislocations—CTAS 2."))
-    if "bleeding" in chief and "deep lacerations" in chief:
-        rules.append((2, "Bleeding deep lacerations—CTAS 2."))
-    if "bleeding" in chief and "uncontrolled" in chief:
-        rules.append((2, "Any uncontrolled bleeding—CTAS 2."))
-    if "bleeding" in chief and "nose" in chief:
-        rules.append((3, "Epistaxis—CTAS 3."))
-    if "bleeding" in chief and "mouth" in chief:
-        rules.append((3, "Oral/gums bleeding—CTAS 3."))
-    if "bleeding" in chief and "joints" in chief:
-        rules.append((3, "Hemarthroses—CTAS 3."))
-    if "menorrhagia" in chief:
-        rules.append((3, "Menorrhagia—CTAS 3."))
-    if "abrasions" in chief:
-        rules.append((3, "Abrasions/superficial lacerations—CTAS 3."))
+    R(2, "Bleeding from head/neck—CTAS 2.", chief=("bleeding",), chief_any=(("head", "neck"),)),
+    R(2, "Bleeding chest/abdomen/pelvis/spine—CTAS 2.", chief=("bleeding",), chief_any=(("chest", "abdomen", "pelvis", "spine"),)),
+    R(2, "Massive vaginal hemorrhage—CTAS 2.", chief=("bleeding", "vaginal")),
+    R(2, "Bleeding iliopsoas/hip—CTAS 2.", chief=("bleeding",), chief_any=(("iliopsoas", "hip"),)),
+    R(2, "Bleeding extremity compartments—CTAS 2.", chief=("bleeding", "extremity muscle compartments")),
+    R(2, "Bleeding with fractures/dislocations—CTAS 2.", chief=("bleeding",), chief_any=(("fractures", "dislocations"),)),
+    R(2, "Bleeding deep lacerations—CTAS 2.", chief=("bleeding", "deep lacerations")),
+    R(2, "Any uncontrolled bleeding—CTAS 2.", chief=("bleeding", "uncontrolled")),
+    R(3, "Epistaxis—CTAS 3.", chief=("bleeding", "nose")),
+    R(3, "Oral/gums bleeding—CTAS 3.", chief=("bleeding", "mouth")),
+    R(3, "Hemarthroses—CTAS 3.", chief=("bleeding", "joints")),
+    R(3, "Menorrhagia—CTAS 3.", chief=("menorrhagia",)),
+    R(3, "Abrasions/superficial lacerations—CTAS 3.", chief=("abrasions",)),
 
     # ---------- Mechanism of injury ----------
-    if "ejection from vehicle" in chief:
-        rules.append((2, "Ejection/rollover—CTAS 2."))
-    if "intrusion" in chief and "passenger" in chief:
-        rules.append((2, "Significant intrusion into passenger space—CTAS 2."))
-    if "fall" in chief and ">18 ft" in chief:
-        rules.append((2, "Fall >18 ft—CTAS 2."))
-    if "penetrating injury" in chief:
-        rules.append((2, "Penetrating head/neck/torso—CTAS 2."))
-    if "head" in chief and "striking windshield" in chief:
-        rules.append((2, "Unrestrained head trauma w/ windshield—CTAS 2."))
-    if "pedestrian struck" in chief:
-        rules.append((2, "Pedestrian struck—CTAS 2."))
-    if "fall" in chief and ">3 ft" in chief:
-        rules.append((2, "Head injury fall >3ft/5 stairs—CTAS 2."))
-    if "axial load to the head" in chief:
-        rules.append((2, "Axial load—CTAS 2."))
-    if "rollover" in chief:
-        rules.append((2, "Vehicle rollover—CTAS 2."))
+    R(2, "Ejection/rollover—CTAS 2.", chief=("ejection from vehicle",)),
+    R(2, "Significant intrusion into passenger space—CTAS 2.", chief=("intrusion", "passenger")),
+    R(2, "Fall >18 ft—CTAS 2.", chief=("fall", ">18 ft")),
+    R(2, "Penetrating head/neck/torso—CTAS 2.", chief=("penetrating injury",)),
+    R(2, "Unrestrained head trauma w/ windshield—CTAS 2.", chief=("head", "striking windshield")),
+    R(2, "Pedestrian struck—CTAS 2.", chief=("pedestrian struck",)),
+    R(2, "Head injury fall >3ft/5 stairs—CTAS 2.", chief=("fall", ">3 ft")),
+    R(2, "Axial load—CTAS 2.", chief=("axial load to the head",)),
+    R(2, "Vehicle rollover—CTAS 2.", chief=("rollover",)),
 
     # ---------- Dehydration ----------
-    if ("severe dehydration" in chief) or ("dehydration" in chief and "shock" in chief):
-        rules.append((1, "Severe dehydration + shock—CTAS 1."))
-    if ("moderate dehydration" in chief or
-        ("dehydration" in chief and any(s in chief for s in ["dry mucous membranes","tachycardia","decreased skin turgor","decreased urine output"]))):
-        rules.append((2, "Moderate dehydration features—CTAS 2."))
-    if ("mild dehydration" in chief or
-        ("dehydration" in chief and any(s in chief for s in ["stable vital signs","thirst","concentrated urine","decreased fluid intake"]))):
-        rules.append((3, "Mild dehydration—CTAS 3."))
-    if ("potential dehydration" in chief or ("fluid loss" in chief and "ongoing" in chief) or ("difficulty tolerating oral fluids" in chief)):
-        rules.append((4, "Potential dehydration—CTAS 4."))
+    # "x dehydration" implies "dehydration", so each "A or (dehydration and B)" folds into one AND.
+    R(1, "Severe dehydration + shock—CTAS 1.", chief=("dehydration",), chief_any=(("severe dehydration", "shock"),)),
+    R(2, "Moderate dehydration features—CTAS 2.", chief=("dehydration",), chief_any=(
+        ("moderate dehydration", "dry mucous membranes", "tachycardia", "decreased skin turgor", "decreased urine output"),)),
+    R(3, "Mild dehydration—CTAS 3.", chief=("dehydration",), chief_any=(
+        ("mild dehydration", "stable vital signs", "thirst", "concentrated urine", "decreased fluid intake"),)),
+    # potential dehydration or (fluid loss and ongoing) or difficulty tolerating oral fluids
+    R(4, "Potential dehydration—CTAS 4.", chief_any=(
+        ("potential dehydration", "fluid loss", "difficulty tolerating oral fluids"),
+        ("potential dehydration", "ongoing", "difficulty tolerating oral fluids"))),
 
     # ---------- Second-order modifiers ----------
-    if "chest pain" in chief and ("ripping" in chief or "tearing" in chief):
-        rules.append((2, "Ripping/tearing chest pain—CTAS 2."))
-    if "extremity weakness" in chief or "cva symptoms" in chief:
-        if "onset < 4.5 hours" in chief:
-            rules.append((2, "CVA symptoms onset <4.5h—CTAS 2."))
-        elif "onset > 4.5 hours" in chief or "resolved" in chief:
-            rules.append((3, "CVA symptoms onset >4.5h / resolved—CTAS 3."))
-    if "difficulty swallowing" in chief or "dysphagia" in chief:
-        if "drooling" in chief or "stridor" in chief:
-            rules.append((2, "Dysphagia + drooling/stridor—CTAS 2."))
-        elif "foreign body" in chief:
-            rules.append((3, "Dysphagia + FB—CTAS 3."))
-    if ("extremity injury" in chief or "upper extremity" in chief or "lower extremity" in chief) and "obvious deformity" in chief:
-        rules.append((3, "Extremity injury + deformity—CTAS 3."))
+    R(2, "Ripping/tearing chest pain—CTAS 2.", chief=("chest pain",), chief_any=(("ripping", "tearing"),)),
+    R(2, "CVA symptoms onset <4.5h—CTAS 2.", chief=("onset < 4.5 hours",), chief_any=(("extremity weakness", "cva symptoms"),)),
+    R(3, "CVA symptoms onset >4.5h / resolved—CTAS 3.", chief_any=(("extremity weakness", "cva symptoms"), ("onset > 4.5 hours", "resolved")),
+      chief_none=("onset < 4.5 hours",)),
+    R(2, "Dysphagia + drooling/stridor—CTAS 2.", chief_any=(("difficulty swallowing", "dysphagia"), ("drooling", "stridor"))),
+    R(3, "Dysphagia + FB—CTAS 3.", chief=("foreign body",), chief_any=(("difficulty swallowing", "dysphagia"),),
+      chief_none=("drooling", "stridor")),
+    R(3, "Extremity injury + deformity—CTAS 3.", chief=("obvious deformity",), chief_any=(("extremity injury", "upper extremity", "lower extremity"),)),
 
     # ---------- Others ----------
-    if "stroke" in chief and "slurred speech" in hist:
-        rules.append((2, "Possible stroke + slurred speech—CTAS 2."))
-    if "seizure" in chief and lt(gcs,14):
-        rules.append((2, "Post-seizure with low GCS—CTAS 2."))
-    if "mild skin rash" in chief:
-        rules.append((4, "Mild rash—CTAS 4."))
-    if "sore throat" in chief and "no fever" in hist:
-        rules.append((5, "Sore throat without fever—CTAS 5."))
+    R(2, "Possible stroke + slurred speech—CTAS 2.", chief=("stroke",), hist_any=("slurred speech",)),
+    R(2, "Post-seizure with low GCS—CTAS 2.", chief=("seizure",), when=(("GCS", "<", 14),)),
+    R(4, "Mild rash—CTAS 4.", chief=("mild skin rash",)),
+    R(5, "Sore throat without fever—CTAS 5.", chief=("sore throat",), hist_any=("no fever",)),
+]
+
+FALLBACK = (5, "Insufficient data or minor complaints — defaulting to CTAS 5.")
+
+# Changes whenever any rule, threshold or description changes; caches of results key on it.
+RULESET_VERSION = hashlib.sha1(repr((RULES, FALLBACK)).encode("utf-8")).hexdigest()[:12]
+
+class CompiledRule(NamedTuple):
+    rule: Rule
+    needs_vitals: FrozenSet[str]        # numeric fields that must be present for `when` to hold
+    chief: FrozenSet[str]
+    chief_any: Tuple[FrozenSet[str], ...]
+    chief_none: FrozenSet[str]
+    hist_any: FrozenSet[str]
+    when: Tuple[Tuple[Tuple[Callable[..., bool], str, tuple], ...], ...]
+    templated: bool
+
+def _groups(when) -> List[Tuple[tuple, ...]]:
+    # A bare atom is a one-atom group; a tuple of atoms is an OR-group.
+    return [(g,) if isinstance(g[0], str) else tuple(g) for g in when]
+
+def compile_rule(rule: Rule) -> CompiledRule:
+    groups = _groups(rule.when)
+    needs = set()
+    for g in groups:
+        fields = {a[0] for a in g}
+        if len(fields) == 1 and fields <= set(NUMERIC_FIELDS):
+            needs |= fields
+    return CompiledRule(
+        rule=rule,
+        needs_vitals=frozenset(needs),
+        chief=frozenset(rule.chief),
+        chief_any=tuple(frozenset(g) for g in rule.chief_any),
+        chief_none=frozenset(rule.chief_none),
+        hist_any=frozenset(rule.hist_any),
+        when=tuple(tuple((OPS[a[1]], a[0], tuple(a[2:])) for a in g) for g in groups),
+        templated="{" in rule.desc,
+    )
+
+COMPILED: List[CompiledRule] = [compile_rule(r) for r in RULES]
+CHIEF_TERMS: FrozenSet[str] = frozenset(t for r in RULES for t in (*r.chief, *r.chief_none, *(x for g in r.chief_any for x in g)))
+HIST_TERMS:  FrozenSet[str] = frozenset(t for r in RULES for t in r.hist_any)
+MATCHER = KeywordMatcher(CHIEF_TERMS | HIST_TERMS)
+
+def patient_fields(vitals: Dict[str, Any], symptoms_present: bool, distress_level: str) -> Dict[str, Any]:
+    p: Dict[str, Any] = {k: num(vitals.get(k)) for k in NUMERIC_FIELDS}
+    p["Location_of_Pain"] = vitals.get("Location_of_Pain") or ""
+    p["Pain_Duration"] = vitals.get("Pain_Duration") or ""
+    p["blood_glucose_symptoms"] = vitals.get("blood_glucose_symptoms") or ""
+    p["symptoms_present"] = symptoms_present
+    p["distress_level"] = distress_level
+    return p
+
+def fired_rules(p: Dict[str, Any], chief_terms: FrozenSet[str], hist_terms: FrozenSet[str]) -> List[int]:
+    """Indices into RULES of every rule that fires, in table order."""
+    present = frozenset(k for k in NUMERIC_FIELDS if p[k] is not None)
+    out = []
+    for i, c in enumerate(COMPILED):
+        if not (c.needs_vitals <= present and c.chief <= chief_terms): continue
+        if c.chief_none & chief_terms: continue
+        if c.hist_any and not (c.hist_any & hist_terms): continue
+        if not all(g & chief_terms for g in c.chief_any): continue
+        if all(any(op(p[f], *args) for op, f, args in g) for g in c.when):
+            out.append(i)
+    return out
+
+def display_desc(desc: str) -> str:
+    """A description for listings and metric labels: the {duration} slot matches any non-acute duration."""
+    return desc.replace("{duration}", "non-acute")
+
+def describe(i: int, p: Dict[str, Any]) -> str:
+    c = COMPILED[i]
+    return c.rule.desc.format(duration=p["Pain_Duration"].lower()) if c.templated else c.rule.desc
+
+def determine_ctas_fired(
+    vitals: Dict[str, Any],
+    chief_complaint: str,
+    history: str,
+    symptoms_present: bool,
+    distress_level: str
+) -> Tuple[int, List[str], List[int]]:
+    """determine_ctas plus the indices into RULES that fired (empty for the fallback)."""
+    chief = (chief_complaint or "").lower()
+    hist  = (history or "").lower()
+    p = patient_fields(vitals, symptoms_present, distress_level)
+
+    fired = fired_rules(p, MATCHER.find(chief), MATCHER.find(hist))
 
     # Fallback
-    if not rules:
-        return 5, ["Insufficient data or minor complaints — defaulting to CTAS 5."]
+    if not fired:
+        return FALLBACK[0], [FALLBACK[1]], fired
+
+    highest = min(RULES[i].level for i in fired)
+    return highest, [describe(i, p) for i in fired], fired
+
+def determine_ctas(
+    vitals: Dict[str, Any],
+    chief_complaint: str,
+    history: str,
+    symptoms_present: bool,
+    distress_level: str
+) -> Tuple[int, List[str]]:
+    level, reasons, _ = determine_ctas_fired(vitals, chief_complaint, history, symptoms_present, distress_level)
+    return level, reasons
+
+# ---------- Rule catalog ----------
+def tokens(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower())
+
+class RuleCatalog:
+    """Precomputed rule listing for /rules_meta and /rules_search.
+
+    Every prefix of every token (description, keywords, vitals) maps to the ids of the
+    rules containing it, so a search is one set lookup per query token plus an
+    intersection: the cost depends on the matches, not on the size of the rule table.
+    """
+
+    def __init__(self, rules: List[Rule]):
+        self.entries: List[Dict[str, Any]] = []
+        for i, r in enumerate(rules):
+            keywords = sorted({*r.chief, *r.chief_none, *r.hist_any, *(t for g in r.chief_any for t in g)})
+            vitals = sorted({a[0] for g in _groups(r.when) for a in g})
+            self.entries.append({"id": i, "ctas": r.level, "desc": display_desc(r.desc), "keywords": keywords, "vitals": vitals})
+        self.order = sorted(range(len(self.entries)), key=lambda i: (self.entries[i]["ctas"], self.entries[i]["desc"]))
+        self.rank = {i: n for n, i in enumerate(self.order)}
+        prefixes: Dict[str, set] = {}
+        for e in self.entries:
+            for tok in {t for text in (e["desc"], *e["keywords"], *e["vitals"]) for t in tokens(text)}:
+                for k in range(1, len(tok) + 1):
+                    prefixes.setdefault(tok[:k], set()).add(e["id"])
+        self.prefixes: Dict[str, FrozenSet[int]] = {p: frozenset(ids) for p, ids in prefixes.items()}
+        self.per_ctas = {f"CTAS {n}": sum(1 for e in self.entries if e["ctas"] == n) for n in range(1, 6)}
+        self.total = len(self.entries)
+
+    def search(self, term: str = "") -> List[Dict[str, Any]]:
+        """Rules whose tokens start with every token of `term`, ordered by (level, description)."""
+        q = tokens(term)
+        if not q:
+            return [self.entries[i] for i in self.order]
+        postings = sorted((self.prefixes.get(t, frozenset()) for t in q), key=len)
+        ids = set(postings[0]).intersection(*postings[1:])
+        return [self.entries[i] for i in sorted(ids, key=self.rank.__getitem__)]
+
+CATALOG = RuleCatalog(RULES)
+
+# ---------- Batch (columnar) evaluation ----------
+# NumPy counterparts of OPS. NaN plays the role of None: every comparison with it is False.
+NP_OPS: Dict[str, Callable[..., Any]] = {
+    "<":      lambda np, v, a: v < a,
+    "<=":     lambda np, v, a: v <= a,
+    ">":      lambda np, v, a: v > a,
+    ">=":     lambda np, v, a: v >= a,
+    "[]":     lambda np, v, a, b: (v >= a) & (v <= b),
+    "[)":     lambda np, v, a, b: (v >= a) & (v < b),
+    "==":     lambda np, v, a: v == a,
+    "!=":     lambda np, v, a: v != a,
+    "in":     lambda np, v, a: np.isin(v, list(a)),
+    "not in": lambda np, v, a: ~np.isin(v, list(a)),
+    "true":   lambda np, v: v.astype(bool),
+    "false":  lambda np, v: ~v.astype(bool),
+}
+
+def determine_ctas_batch(
+    vitals: Dict[str, Any],
+    chief_complaints: Sequence[str],
+    histories: Sequence[str],
+    symptoms_present: Sequence[bool],
+    distress_levels: Sequence[str]
+):
+    """Columnar determine_ctas.
+
+    `vitals` maps NUMERIC_FIELDS to float arrays (NaN = missing) and Location_of_Pain /
+    Pain_Duration / blood_glucose_symptoms to string arrays; absent keys count as missing.
+    Returns (levels int8[n], fired uint8[n, ceil(len(RULES)/8)]) where bit i of a row
+    (np.unpackbits(..., bitorder="little")) is set when RULES[i] fired. Row-for-row equal to
+    determine_ctas; use batch_reasons() for the reason strings.
+    """
+    import numpy as np
+
+    n = len(chief_complaints)
+    cols: Dict[str, Any] = {}
+    for k in NUMERIC_FIELDS:
+        cols[k] = np.asarray(vitals[k], dtype=float) if k in vitals else np.full(n, np.nan)
+    for k in ("Location_of_Pain", "Pain_Duration", "blood_glucose_symptoms"):
+        cols[k] = np.array([x or "" for x in vitals[k]], dtype=object) if k in vitals else np.full(n, "", dtype=object)
+    cols["symptoms_present"] = np.array([bool(x) for x in symptoms_present])
+    cols["distress_level"] = np.array(list(distress_levels), dtype=object)
+
+    terms = sorted(MATCHER.terms)
+    col_of = {t: j for j, t in enumerate(terms)}
+    in_chief = np.zeros((n, len(terms)), dtype=bool)
+    in_hist = np.zeros((n, len(terms)), dtype=bool)
+    for i, (c, h) in enumerate(zip(chief_complaints, histories)):
+        for t in MATCHER.find((c or "").lower()): in_chief[i, col_of[t]] = True
+        for t in MATCHER.find((h or "").lower()): in_hist[i, col_of[t]] = True
+
+    def has_all(m, ts): return m[:, [col_of[t] for t in ts]].all(axis=1)
+    def has_any(m, ts): return m[:, [col_of[t] for t in ts]].any(axis=1)
+
+    atoms: Dict[tuple, Any] = {}
+    def atom(a):
+        if a not in atoms: atoms[a] = NP_OPS[a[1]](np, cols[a[0]], *a[2:])
+        return atoms[a]
+
+    fired = np.zeros((n, len(RULES)), dtype=bool)
+    for j, r in enumerate(RULES):
+        m = np.ones(n, dtype=bool)
+        if r.chief:      m &= has_all(in_chief, r.chief)
+        for g in r.chief_any: m &= has_any(in_chief, g)
+        if r.chief_none: m &= ~has_any(in_chief, r.chief_none)
+        if r.hist_any:   m &= has_any(in_hist, r.hist_any)
+        for g in _groups(r.when):
+            m &= np.logical_or.reduce([atom(a) for a in g])
+        fired[:, j] = m
+
+    levels = np.array([r.level for r in RULES], dtype=np.int8)
+    ctas = np.where(fired, levels, np.int8(FALLBACK[0])).min(axis=1).astype(np.int8)
+    return ctas, np.packbits(fired, axis=1, bitorder="little")
 
-    highest = min(r[0] for r in rules)
-    return highest, [r[1] for r in rules]
+def batch_reasons(bits, pain_duration: str = "") -> List[str]:
+    """Reason strings for one row of determine_ctas_batch's bitmask, as determine_ctas returns them."""
+    import numpy as np
+    idx = np.flatnonzero(np.unpackbits(bits, bitorder="little")[:len(RULES)])
+    if not len(idx):
+        return [FALLBACK[1]]
+    p = {"Pain_Duration": pain_duration or ""}
+    return [describe(int(i), p) for i in idx]
@@ -0,0 +1,791 @@
+import glob, gzip, hashlib, json, logging, os, re, sqlite3, threading, time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+from app.metrics import REGISTRY, STAGE_SECONDS
+try:
+    import fcntl
+except ImportError:     # Windows: single-process installs only
+    fcntl = None
+
+LEVELS = [f"CTAS {i}" for i in range(1, 6)]
+RECENT_PER_LEVEL = 120
+SAVE_EVERY = 1000       # persist the index after this many newly indexed lines
+ROTATE_BYTES = 64 * 1024 * 1024
+
+TORN_LINES = REGISTRY.counter("triage_jsonl_torn_lines_total",
+                              "JSONL lines that did not parse (torn or interleaved writes), skipped by readers.", ("log",))
+
+def append_locked(path: str, data: bytes, fsync: bool = False):
+    """Append `data` to a log in one O_APPEND write under an exclusive flock() of the log.
+
+    Uvicorn workers share the files, and a buffered text-mode append of a large batch is
+    several write() calls that other processes' appends can land between. begin_seal()
+    takes the same lock before renaming the log, so a writer that waited on a log that was
+    sealed meanwhile sees another inode at `path` and reopens. If a crashed writer left a
+    final line without its newline, one is written first so only that line is lost.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    while True:
+        fd = os.open(path, os.O_RDWR | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                try:
+                    if not os.path.samestat(os.fstat(fd), os.stat(path)): continue
+                except FileNotFoundError:
+                    continue
+                size = os.fstat(fd).st_size
+                if size and os.pread(fd, 1, size - 1) != b"\n":
+                    logging.warning(f"{path} ended in a partial line; terminating it before appending")
+                    data = b"\n" + data
+            view = memoryview(data)
+            while view:
+                view = view[os.write(fd, view):]
+            if fsync: os.fsync(fd)
+            return
+        finally:
+            os.close(fd)        # releases the lock
+
+def save_line_json(path: str, obj: dict):
+    append_locked(path, (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8"))
+
+def save_lines_json(path: str, objs, fsync: bool = False):
+    """Append many records with a single locked write (and one fsync if asked)."""
+    data = "".join(json.dumps(o, ensure_ascii=False) + "\n" for o in objs)
+    if data:
+        append_locked(path, data.encode("utf-8"), fsync)
+
+def _iter_file_json(f, log: str = ""):
+    """Parsed lines; unparseable ones are counted in TORN_LINES (per log name) and logged."""
+    torn = 0
+    for ln in f:
+        ln = ln.strip()
+        if ln:
+            try:
+                yield json.loads(ln)
+            except ValueError:
+                torn += 1
+    if torn:
+        TORN_LINES.inc(re.sub(r"\.\d{6}(\.gz)?$", "", os.path.basename(log)), n=torn)
+        logging.warning(f"Skipped {torn} unparseable line(s) in {log or 'log'}")
+
+def open_segment(segment: str):
+    """A segment as text; one listed uncompressed may have been sealed since, then read the `.gz`."""
+    if segment.endswith(".gz"):
+        return gzip.open(segment, "rt", encoding="utf-8")
+    try:
+        return open(segment, "r", encoding="utf-8")
+    except FileNotFoundError:
+        return gzip.open(segment + ".gz", "rt", encoding="utf-8")
+
+def iter_log_lines(path: str):
+    """Raw text lines of a JSONL log, oldest first: sealed segments, then the active file."""
+    for seg in _segments(path):
+        with open_segment(seg) as f:
+            yield from f
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        yield from f
+
+def iter_lines_json(path: str):
+    return _iter_file_json(iter_log_lines(path), path)
+
+def load_lines_json(path: str):
+    return list(iter_lines_json(path))
+
+# ---------- Log segments ----------
+# A rotated log `records.json` is sealed into `records.json.000001.gz`, ... with a summary
+# sidecar `records.json.000001.summary.json`; the active file keeps the original name.
+def segment_paths(path: str) -> List[str]:
+    """Sealed, compressed segments of a JSONL log, oldest first."""
+    return sorted(glob.glob(glob.escape(path) + ".[0-9][0-9][0-9][0-9][0-9][0-9].gz"))
+
+def _unsealed(path: str) -> List[str]:
+    return sorted(glob.glob(glob.escape(path) + ".[0-9][0-9][0-9][0-9][0-9][0-9]"))
+
+def _segments(path: str) -> List[str]:
+    """Sealed segments plus any still being compressed, oldest first."""
+    segs = {p[:-len(".gz")]: p for p in segment_paths(path)}
+    for raw in _unsealed(path): segs.setdefault(raw, raw)
+    return [segs[k] for k in sorted(segs)]
+
+def summary_path(segment: str) -> str:
+    return (segment[:-len(".gz")] if segment.endswith(".gz") else segment) + ".summary.json"
+
+def fold_segment(segment: str, stats) -> dict:
+    """Fold one segment into a fresh stats object; returns its summary."""
+    lines, lo, hi = 0, None, None
+    with open_segment(segment) as f:
+        for obj in _iter_file_json(f, segment):
+            if isinstance(obj, dict):
+                lines += 1
+                stats.add(obj)
+                ts = str(obj.get("timestamp") or "")
+                if ts:
+                    lo = ts if lo is None or ts < lo else lo
+                    hi = ts if hi is None or ts > hi else hi
+    return {"segment": os.path.basename(segment[:-len(".gz")] if segment.endswith(".gz") else segment) + ".gz",
+            "lines": lines, "min_timestamp": lo, "max_timestamp": hi, **stats.state()}
+
+def write_summary(segment: str, summary: dict):
+    tmp = summary_path(segment) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False)
+    os.replace(tmp, summary_path(segment))
+
+def load_summary(segment: str, stats_type) -> dict:
+    """Summary of a segment; read from its sidecar, or folded from the data if that is missing."""
+    try:
+        with open(summary_path(segment), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        pass
+    summary = fold_segment(segment, stats_type())
+    if segment.endswith(".gz"):
+        logging.warning(f"Summary for {segment} missing or unreadable; rebuilt it")
+        write_summary(segment, summary)
+    return summary
+
+class SegmentLock:
+    """Cross-process lock (`<path>.lock`) held for a whole seal of one log, from the rename
+    until the segment is compressed. With `wait=False`, `held` is False (and nothing is
+    locked) when another process has it."""
+
+    def __init__(self, path: str, wait: bool = True):
+        self.path, self.wait = path + ".lock", wait
+
+    def __enter__(self):
+        self.f = open(self.path, "a")
+        self.held = True
+        if fcntl:
+            try:
+                fcntl.flock(self.f, fcntl.LOCK_EX | (0 if self.wait else fcntl.LOCK_NB))
+            except BlockingIOError:
+                self.held = False
+        return self
+
+    def __exit__(self, *exc):
+        if fcntl and self.held: fcntl.flock(self.f, fcntl.LOCK_UN)
+        self.f.close()
+
+def begin_seal(path: str, head: str, catch_up: Callable) -> Optional[str]:
+    """Rename the active log to the next segment number, unless another process already did.
+
+    Writers open the log by name for every append, so new lines go to a fresh active file;
+    the rename happens under the writers' lock (append_locked), so no append is in flight.
+    Lines other processes appended since the caller's last refresh are passed to
+    `catch_up(f)` first, so the caller's state covers the whole segment it seals.
+    The caller holds the log's SegmentLock.
+    """
+    try:
+        with open(path, "rb") as f:
+            if fcntl: fcntl.flock(f, fcntl.LOCK_EX)
+            if hashlib.sha1(f.readline()).hexdigest() != head:
+                return None
+            catch_up(f)
+            segs = _segments(path)
+            seq = int(segs[-1][len(path) + 1:len(path) + 7]) + 1 if segs else 1
+            raw = f"{path}.{seq:06d}"
+            os.replace(path, raw)
+            return raw
+    except FileNotFoundError:
+        return None
+
+def finish_seal(raw: str, stats_type):
+    """Summarize and compress a renamed segment, holding the log's SegmentLock. The summary
+    lands before the `.gz`, so a reader that sees a sealed segment can always merge it;
+    until then it reads `raw`."""
+    if not os.path.exists(raw):
+        return
+    write_summary(raw, fold_segment(raw, stats_type()))
+    tmp = raw + ".gz.tmp"
+    with open(raw, "rb") as src, gzip.open(tmp, "wb", compresslevel=6) as dst:
+        while True:
+            chunk = src.read(1 << 20)
+            if not chunk: break
+            dst.write(chunk)
+    os.replace(tmp, raw + ".gz")
+    os.remove(raw)
+
+def recover_segments(path: str, stats_type):
+    """Finish seals interrupted by a crash (renamed but not yet compressed). A process that
+    is sealing holds the SegmentLock until the `.gz` is written, so while the lock is taken
+    the raw segments are that seal's, not a crashed one's."""
+    if not _unsealed(path):
+        return
+    with SegmentLock(path, wait=False) as seal:
+        if not seal.held:
+            return
+        for raw in _unsealed(path):
+            logging.warning(f"Finishing interrupted seal of {raw}")
+            finish_seal(raw, stats_type)
+
+def record_level(r: dict) -> Optional[int]:
+    lvl = r.get("ctas_level")
+    if isinstance(lvl, str) and lvl.isdigit(): lvl = int(lvl)
+    return lvl if isinstance(lvl, int) and 1 <= lvl <= 5 else None
+
+def feedback_decision(fb: dict) -> str:
+    return (fb.get("decision") or fb.get("feedback_decision") or "").lower()
+
+def feedback_level(fb: dict) -> Optional[int]:
+    lvl = record_level(fb)
+    if lvl is None:
+        why = fb.get("reason") or fb.get("reasons") or ""
+        if isinstance(why, list): why = ",".join(map(str, why))
+        m = re.search(r"ctas\s*([1-5])", str(why), re.I)
+        if m: lvl = int(m.group(1))
+    return lvl
+
+def record_card(r: dict, key: str) -> dict:
+    return {"id": r.get("timestamp",""), "ctas": key, "chief": r.get("chief_complaint",""),
+            "history": r.get("history",""), "timestamp": r.get("timestamp",""), "source": "record"}
+
+def feedback_card(fb: dict, key: str) -> dict:
+    return {"id": fb.get("id") or fb.get("timestamp") or "", "ctas": key,
+            "chief": fb.get("chief_complaint") or fb.get("chief") or "", "history": fb.get("history") or "",
+            "timestamp": fb.get("timestamp") or "", "source": "feedback"}
+
+class RecordStats:
+    """Materialized record analytics: per-level totals plus a ring of the newest cards per level."""
+
+    def __init__(self):
+        self.changes = 0        # bumped on every fold/reset; keys caches of derived payloads
+        self.reset()
+
+    def reset(self):
+        self.changes += 1
+        self.count = 0
+        self.last: dict = {}
+        self.totals = {k: 0 for k in LEVELS}
+        self.recent = {k: deque(maxlen=RECENT_PER_LEVEL) for k in LEVELS}   # record cards, oldest first
+
+    def add(self, r: dict):
+        self.changes += 1
+        self.count += 1
+        self.last = r
+        lvl = record_level(r)
+        if lvl is not None:
+            key = f"CTAS {lvl}"
+            self.totals[key] += 1
+            self.recent[key].append(record_card(r, key))
+
+    def state(self) -> dict:
+        return {"count": self.count, "last": self.last, "totals": self.totals,
+                "recent": {k: list(v) for k, v in self.recent.items()}}
+
+    def restore(self, st: dict):
+        self.count, self.last, self.totals = st["count"], st["last"], st["totals"]
+        self.recent = {k: deque(st["recent"][k], maxlen=RECENT_PER_LEVEL) for k in LEVELS}
+
+    def merge(self, st: dict):
+        """Fold in the state of a later log segment."""
+        self.changes += 1
+        self.count += st["count"]
+        self.last = st["last"] or self.last
+        for k in LEVELS:
+            self.totals[k] += st["totals"][k]
+            self.recent[k].extend(st["recent"][k])
+
+    def recent_cards(self) -> Dict[str, List[dict]]:
+        # sort is stable, so equal timestamps keep insertion order
+        return {k: sorted(v, key=lambda x: x["timestamp"], reverse=True) for k, v in self.recent.items()}
+
+class FeedbackStats:
+    """Materialized feedback analytics: decision counters and the leveled decision cards."""
+
+    def __init__(self):
+        self.changes = 0
+        self.reset()
+
+    def reset(self):
+        self.changes += 1
+        self.count = self.accepted = self.declined = 0
+        self.acc = {k: 0 for k in LEVELS}
+        self.rej = {k: 0 for k in LEVELS}
+        self.cases: Dict[str, List[dict]] = {"accept": [], "decline": []}
+
+    def add(self, fb: dict):
+        self.changes += 1
+        self.count += 1
+        d = feedback_decision(fb)
+        if d == "accept": self.accepted += 1
+        elif d == "decline": self.declined += 1
+        else: return
+        lvl = feedback_level(fb)
+        if lvl is None: return
+        key = f"CTAS {lvl}"
+        (self.acc if d == "accept" else self.rej)[key] += 1
+        self.cases[d].append(feedback_card(fb, key))
+
+    def state(self) -> dict:
+        return {"count": self.count, "accepted": self.accepted, "declined": self.declined,
+                "acc": self.acc, "rej": self.rej, "cases": self.cases}
+
+    def restore(self, st: dict):
+        self.count, self.accepted, self.declined = st["count"], st["accepted"], st["declined"]
+        self.acc, self.rej, self.cases = st["acc"], st["rej"], st["cases"]
+
+    def merge(self, st: dict):
+        self.changes += 1
+        self.count += st["count"]; self.accepted += st["accepted"]; self.declined += st["declined"]
+        for k in LEVELS:
+            self.acc[k] += st["acc"][k]; self.rej[k] += st["rej"][k]
+        for d in self.cases: self.cases[d].extend(st["cases"][d])
+
+class JsonlIndex:
+    """Folds an append-only JSONL file into a stats object (RecordStats / FeedbackStats).
+
+    `offset` is the byte position in the active file up to which lines have been folded
+    in. The state is persisted next to the file (`<path>.idx`), so a restart only
+    tail-reads the bytes appended since; a truncated or replaced file is detected and
+    reindexed from the sealed segments' summaries plus the active file. Once the active
+    file passes `rotate_bytes` (or, with `daily`, a new day starts) it is sealed into a
+    compressed segment. Callers serialize access through `lock`.
+    """
+
+    VERSION = 3
+
+    def __init__(self, path: str, stats, lock, rotate_bytes: int = ROTATE_BYTES, daily: bool = False):
+        self.path = path
+        self.index_path = path + ".idx"
+        self.stats = stats
+        self.lock = lock
+        self.rotate_bytes, self.daily = rotate_bytes, daily
+        self.offset = 0
+        self.head = ""          # sha1 of the first line, to detect a replaced file
+        self.day = ""           # date of the active file's first line, for daily rotation
+        self.sealed = 0         # segments folded into the state
+        self.unsaved = 0
+        self.torn = 0           # unparseable lines skipped in the active file by this process
+        self.ino = 0            # inode of the active file as last read (0: not read yet)
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                st = json.load(f)
+            if st.get("version") != self.VERSION or st["sealed"] != len(_segments(self.path)):
+                self.rebuild_state()    # older layout, or rotated since; refresh() reads the active file
+                return
+            self.offset, self.head, self.day, self.sealed = st["offset"], st["head"], st["day"], st["sealed"]
+            self.stats.restore(st)
+        except FileNotFoundError:
+            self.rebuild_state()
+        except Exception as e:
+            logging.error(f"Index {self.index_path} unreadable, rebuilding: {e}")
+            self.rebuild_state()
+
+    def save(self):
+        with self.lock:
+            st = {"version": self.VERSION, "offset": self.offset, "head": self.head, "day": self.day,
+                  "sealed": self.sealed, **self.stats.state()}
+            tmp = f"{self.index_path}.{os.getpid()}.tmp"    # workers save the same index
+            try:
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(st, f, ensure_ascii=False)
+                os.replace(tmp, self.index_path)
+                self.unsaved = 0
+            except Exception as e:
+                logging.error(f"Index save error: {e}")
+
+    def rebuild_state(self):
+        self.offset, self.head, self.day, self.ino = 0, "", "", 0
+        self.stats.reset()
+        segs = _segments(self.path)
+        for seg in segs:
+            self.stats.merge(load_summary(seg, type(self.stats)))
+        self.sealed = len(segs)
+
+    def _first_line_hash(self, f) -> str:
+        f.seek(0)
+        return hashlib.sha1(f.readline()).hexdigest()
+
+    def refresh(self):
+        """Fold any lines appended since the last call into the state.
+
+        Other processes seal the active file under us. Whenever the state is rebuilt, the
+        active file is reopened, and a fresh one is only adopted if no segment appeared
+        between listing the segments and opening it; otherwise the state would miss that
+        segment or fold its lines twice.
+        """
+        with self.lock:
+            while True:
+                try:
+                    st = os.stat(self.path)
+                except OSError:
+                    # gone: rotated (possibly by another process) or deleted
+                    if self.offset or len(_segments(self.path)) != self.sealed: self.rebuild_state()
+                    return
+                if st.st_size == self.offset and st.st_ino == self.ino:
+                    return
+                try:
+                    f = open(self.path, "rb")
+                except FileNotFoundError:
+                    continue            # sealed between stat() and open()
+                with f:
+                    size = os.fstat(f.fileno()).st_size
+                    if self.offset and (size < self.offset or self._first_line_hash(f) != self.head):
+                        if len(_segments(self.path)) == self.sealed:
+                            logging.warning(f"{self.path} was truncated or replaced; reindexing")
+                        self.rebuild_state()
+                        continue
+                    if not self.offset:
+                        if len(_segments(self.path)) != self.sealed:
+                            self.rebuild_state()    # sealed by another process since our state was built
+                            continue
+                        self.head = self._first_line_hash(f)
+                    self.ino = os.fstat(f.fileno()).st_ino
+                    self.fold_tail(f)
+                break
+            if self.unsaved >= SAVE_EVERY:
+                self.save()
+
+    def fold_tail(self, f):
+        """Fold the complete lines of `f` past `offset` into the state."""
+        f.seek(self.offset)
+        pos = self.offset
+        for raw in f:
+            if not raw.endswith(b"\n"):
+                break   # partial line still being written
+            pos += len(raw)
+            ln = raw.strip()
+            if ln:
+                try:
+                    obj = json.loads(ln)
+                except ValueError:
+                    obj = None
+                    self.torn += 1
+                    TORN_LINES.inc(os.path.basename(self.path))
+                    logging.warning(f"Unparseable line at byte {pos - len(raw)} of {self.path}; skipped")
+                if isinstance(obj, dict):
+                    self.unsaved += 1
+                    self.stats.add(obj)
+                    if not self.day: self.day = str(obj.get("timestamp") or "")[:10] or time.strftime("%Y-%m-%d")
+        self.offset = pos
+
+    def due(self) -> bool:
+        return bool(self.offset) and (self.offset >= self.rotate_bytes
+                                      or bool(self.daily and self.day and self.day < time.strftime("%Y-%m-%d")))
+
+    def maybe_rotate(self):
+        """Seal the active file if it is due; call right after refresh()."""
+        with self.lock:
+            if not self.due(): return
+        with SegmentLock(self.path, wait=False) as seal:
+            if not seal.held:
+                return          # another process is sealing this log; the next refresh() reindexes
+            with self.lock:
+                if not self.due(): return
+                raw = begin_seal(self.path, self.head, self.fold_tail)
+                if raw is None:
+                    return      # another process rotated first; the next refresh() reindexes
+                self.offset, self.head, self.day, self.ino = 0, "", "", 0
+                self.sealed += 1
+                self.save()
+            finish_seal(raw, type(self.stats))      # compress outside the index lock; readers use `raw` until then
+
+# ---------- Storage backends ----------
+class Storage:
+    """Where records and feedback live. Endpoints only talk to this interface.
+
+    Analytics come from a materialized view (`rec`, `fb`) that each backend folds new
+    rows into as they are written, so reads cost the same however long the history is.
+    The view is rebuilt from the log on open(); refresh() also folds in rows written by
+    other processes sharing the same files/database.
+    """
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.rec, self.fb = RecordStats(), FeedbackStats()
+
+    def open(self): pass
+    def close(self): pass
+    def refresh(self): pass
+    def append_record(self, rec: dict): self.append_records([rec])
+    def append_records(self, recs: List[dict]): raise NotImplementedError
+    def append_feedback(self, fb: dict): raise NotImplementedError
+    def record_lines(self) -> Iterable[str]:
+        """Every stored record as JSON text, oldest first (offline replays; no view needed)."""
+        raise NotImplementedError
+    def write_rows(self, pending: Dict[str, List[dict]]):
+        """Durably write `pending["records"]` and `pending["feedback"]` (one sync per batch where
+        possible), deleting each key once its rows are stored, so retrying with the same dict
+        after an error writes only what is left. The view is not updated; see after_write()."""
+        raise NotImplementedError
+
+    def after_write(self):
+        """Fold just-written rows into the view (and any housekeeping a write makes due)."""
+        self.refresh()
+
+    def write_batch(self, recs: List[dict], fbs: List[dict]):
+        """write_rows() then after_write(). Once the rows are stored an after_write() error is
+        only logged: raising would get them written again, and the next refresh() folds them in."""
+        self.write_rows({"records": recs, "feedback": fbs})
+        try:
+            self.after_write()
+        except Exception as e:
+            logging.error(f"Refresh after write failed (rows are stored): {e}")
+
+    def version(self) -> tuple:
+        """Changes whenever the view does; cheap enough to call per request."""
+        with self.lock:
+            self.refresh()
+            return self.rec.changes, self.fb.changes
+
+    def seq(self) -> int:
+        """Rows in the view right now, without refreshing; see counts()."""
+        return self.rec.count + self.fb.count
+
+    def last_record(self) -> dict:
+        with self.lock:
+            self.refresh()
+            return self.rec.last
+
+    def counts(self) -> Dict[str, int]:
+        """{"records", "feedback", "accepted", "declined", "seq"}; `seq` counts every row in the
+        view, so all processes agree on it once refreshed (the /events sequence number)."""
+        with self.lock:
+            self.refresh()
+            return {"records": self.rec.count, "feedback": self.fb.count,
+                    "accepted": self.fb.accepted, "declined": self.fb.declined,
+                    "seq": self.seq()}
+
+    def ctas_totals(self) -> Dict[str, int]:
+        with self.lock:
+            self.refresh()
+            return dict(self.rec.totals)
+
+    def feedback_by_ctas(self):
+        """(accepted, rejected) counts per level, for feedback whose level is known."""
+        with self.lock:
+            self.refresh()
+            return dict(self.fb.acc), dict(self.fb.rej)
+
+    def recent_records(self) -> Dict[str, List[dict]]:
+        """Newest RECENT_PER_LEVEL record cards per level, newest first."""
+        with self.lock:
+            self.refresh()
+            return self.rec.recent_cards()
+
+    def feedback_cases(self) -> Dict[str, List[dict]]:
+        """{"accept": cards, "decline": cards} in insertion order."""
+        with self.lock:
+            self.refresh()
+            return {d: list(v) for d, v in self.fb.cases.items()}
+
+class JsonlStorage(Storage):
+    """Append-only JSONL files plus their incremental indexes; fine for small installs.
+
+    Each log rotates into compressed segments at `rotate_bytes` (and at midnight with
+    `rotate_daily`); readers span sealed segments and the active file transparently.
+    """
+
+    def __init__(self, records_path: str, feedback_path: str, rotate_bytes: int = ROTATE_BYTES, rotate_daily: bool = False):
+        super().__init__()
+        self.records_path, self.feedback_path = records_path, feedback_path
+        self.records = JsonlIndex(records_path, self.rec, self.lock, rotate_bytes, rotate_daily)
+        self.feedback = JsonlIndex(feedback_path, self.fb, self.lock, rotate_bytes, rotate_daily)
+
+    def refresh(self):
+        with STAGE_SECONDS.time("jsonl_read"):
+            self.records.refresh(); self.feedback.refresh()
+
+    def rotate(self):
+        self.records.maybe_rotate(); self.feedback.maybe_rotate()
+
+    def open(self):
+        recover_segments(self.records_path, RecordStats)
+        recover_segments(self.feedback_path, FeedbackStats)
+        self.refresh()
+        self.rotate()
+
+    def close(self):
+        self.records.save(); self.feedback.save()
+
+    def record_lines(self):
+        return iter_log_lines(self.records_path)
+
+    def append_records(self, recs):
+        with STAGE_SECONDS.time("jsonl_write"):
+            save_lines_json(self.records_path, recs)
+        self.refresh(); self.rotate()
+
+    def append_feedback(self, fb):
+        with STAGE_SECONDS.time("jsonl_write"):
+            save_line_json(self.feedback_path, fb)
+        self.refresh(); self.rotate()
+
+    def write_rows(self, pending):
+        with STAGE_SECONDS.time("jsonl_write"):
+            for key, path in (("records", self.records_path), ("feedback", self.feedback_path)):
+                if key in pending:
+                    save_lines_json(path, pending[key], fsync=True)
+                    del pending[key]
+
+    def after_write(self):
+        self.refresh(); self.rotate()
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT, ctas_level INTEGER, chief_complaint TEXT, history TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS records_timestamp ON records (timestamp);
+CREATE INDEX IF NOT EXISTS records_level_timestamp ON records (ctas_level, timestamp);
+CREATE TABLE IF NOT EXISTS feedback (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT, decision TEXT, ctas_level INTEGER, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS feedback_timestamp ON feedback (timestamp);
+CREATE INDEX IF NOT EXISTS feedback_decision_level ON feedback (decision, ctas_level);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+class SqliteStorage(Storage):
+    """SQLite (WAL) backend; one connection per thread, one transaction per write batch.
+
+    The view is snapshotted into `meta` (with the row ids it covers) every SAVE_EVERY
+    folded rows and on close(), so open() only reads rows written after the snapshot.
+    """
+
+    VIEW_VERSION = 1
+
+    def __init__(self, db_path: str, import_from: Optional[tuple] = None):
+        super().__init__()
+        self.db_path = db_path
+        self.import_from = import_from      # (records.json, feedback.json) to import once
+        self.seen = {"records": 0, "feedback": 0}     # highest row id folded into the view
+        self.unsaved = 0
+        self.local = threading.local()
+
+    def conn(self) -> sqlite3.Connection:
+        c = getattr(self.local, "conn", None)
+        if c is None:
+            if os.path.dirname(self.db_path): os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
+            c = sqlite3.connect(self.db_path, timeout=30)
+            c.execute("PRAGMA journal_mode=WAL")
+            c.execute("PRAGMA synchronous=FULL")     # one fsync per commit; the write queue batches commits
+            c.executescript(SCHEMA)
+            self.local.conn = c
+        return c
+
+    def open(self):
+        if self.import_from:
+            self.import_jsonl(*self.import_from)
+        self.load_view()
+        self.refresh()
+
+    def refresh(self):
+        c = self.conn()
+        with self.lock, STAGE_SECONDS.time("sqlite_read"):
+            for table, stats in (("records", self.rec), ("feedback", self.fb)):
+                for rid, data in c.execute(f"SELECT id, data FROM {table} WHERE id > ? ORDER BY id", (self.seen[table],)):
+                    stats.add(json.loads(data))
+                    self.seen[table] = rid
+                    self.unsaved += 1
+            if self.unsaved >= SAVE_EVERY:
+                self.save_view()
+
+    def load_view(self):
+        row = self.conn().execute("SELECT value FROM meta WHERE key='view'").fetchone()
+        if row is None:
+            return
+        try:
+            st = json.loads(row[0])
+            if st.get("version") != self.VIEW_VERSION:
+                return
+            with self.lock:
+                self.rec.restore(st["records"]); self.fb.restore(st["feedback"])
+                self.seen = {"records": st["seen"]["records"], "feedback": st["seen"]["feedback"]}
+                self.rec.changes += 1; self.fb.changes += 1
+        except Exception as e:
+            logging.error(f"View snapshot in {self.db_path} unreadable, rebuilding: {e}")
+            with self.lock:
+                self.rec.reset(); self.fb.reset()
+                self.seen = {"records": 0, "feedback": 0}
+
+    def save_view(self):
+        """Store the view unless another worker already stored a newer one."""
+        with self.lock:
+            st = {"version": self.VIEW_VERSION, "seen": dict(self.seen),
+                  "records": self.rec.state(), "feedback": self.fb.state()}
+            c = self.conn()
+            try:
+                c.execute("BEGIN IMMEDIATE")
+                row = c.execute("SELECT value FROM meta WHERE key='view'").fetchone()
+                try:
+                    old = json.loads(row[0])["seen"] if row else {}
+                except (ValueError, KeyError, TypeError):
+                    old = {}
+                if old.get("records", 0) <= self.seen["records"] and old.get("feedback", 0) <= self.seen["feedback"]:
+                    c.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('view', ?)", (json.dumps(st, ensure_ascii=False),))
+                c.commit()
+                self.unsaved = 0
+            except Exception as e:
+                c.rollback()
+                logging.error(f"View snapshot save error: {e}")
+
+    def close(self):
+        if self.unsaved: self.save_view()
+        c = getattr(self.local, "conn", None)
+        if c is not None:
+            c.close(); self.local.conn = None
+
+    def import_jsonl(self, records_path: str, feedback_path: str):
+        """Copy existing JSONL history in, once per database."""
+        c = self.conn()
+        c.execute("BEGIN IMMEDIATE")    # other workers wait here instead of importing twice
+        try:
+            if c.execute("SELECT 1 FROM meta WHERE key='jsonl_imported'").fetchone():
+                c.rollback()
+                return
+            self._insert_records(c, (r for r in iter_lines_json(records_path) if isinstance(r, dict)))
+            for fb in iter_lines_json(feedback_path):
+                if isinstance(fb, dict): self._insert_feedback(c, fb)
+            c.execute("INSERT INTO meta (key, value) VALUES ('jsonl_imported', ?)", (f"{records_path},{feedback_path}",))
+            c.commit()
+        except Exception:
+            c.rollback()
+            raise
+        logging.info(f"Imported JSONL history into {self.db_path}")
+
+    def _insert_records(self, c, recs: Iterable[dict]):
+        c.executemany(
+            "INSERT INTO records (timestamp, ctas_level, chief_complaint, history, data) VALUES (?,?,?,?,?)",
+            ((r.get("timestamp",""), record_level(r), r.get("chief_complaint",""), r.get("history",""),
+              json.dumps(r, ensure_ascii=False)) for r in recs))
+
+    def _insert_feedback(self, c, fb: dict):
+        c.execute("INSERT INTO feedback (timestamp, decision, ctas_level, data) VALUES (?,?,?,?)",
+                  (fb.get("timestamp") or "", feedback_decision(fb), feedback_level(fb), json.dumps(fb, ensure_ascii=False)))
+
+    def record_lines(self):
+        for (data,) in self.conn().execute("SELECT data FROM records ORDER BY id"):
+            yield data
+
+    def append_records(self, recs):
+        c = self.conn()
+        with STAGE_SECONDS.time("sqlite_write"), c:
+            self._insert_records(c, recs)
+        self.refresh()
+
+    def append_feedback(self, fb):
+        c = self.conn()
+        with STAGE_SECONDS.time("sqlite_write"), c:
+            self._insert_feedback(c, fb)
+        self.refresh()
+
+    def write_rows(self, pending):
+        c = self.conn()
+        with STAGE_SECONDS.time("sqlite_write"), c:     # one transaction: all of the batch or none of it
+            self._insert_records(c, pending.get("records", ()))
+            for fb in pending.get("feedback", ()): self._insert_feedback(c, fb)
+        pending.clear()
+
+def make_storage(backend: str, records_path: str, feedback_path: str, db_path: str, **jsonl_opts) -> Storage:
+    if backend == "jsonl":
+        return JsonlStorage(records_path, feedback_path, **jsonl_opts)
+    if backend == "sqlite":
+        return SqliteStorage(db_path, import_from=(records_path, feedback_path))
+    raise ValueError(f"Unknown storage backend: {backend!r}")
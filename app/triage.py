@@ -0,0 +1,216 @@
+from typing import Dict
+from datetime import datetime
+import codecs, hashlib, json, os
+
+from app.cache import VersionedLRU
+
+VITAL_RANGES = {
+    "Systolic": {"valid": (60, 260), "normal": (90, 120)},
+    "Diastolic": {"valid": (30, 160), "normal": (60, 80)},
+    "TEMPERATURE": {"valid": (30.0, 43.0), "normal": (36.1, 37.8)},
+    "hr": {"valid": (30, 220), "normal": (60, 100)},
+    "RR": {"valid": (6, 35), "normal": (12, 20)},
+    "O2_Sat": {"valid": (50, 100), "normal": (95, 100)},
+    "GCS": {"valid": (3, 15), "normal": (15, 15)},
+    "blood_glucose": {"valid": (20, 600), "normal": (70, 140)},
+    "Pain_Scale": {"valid": (0, 10), "normal": (0, 3)},
+}
+VITAL_FIELDS = tuple(VITAL_RANGES)
+# int8 codes used by classify_vital_signs_batch; VITAL_CLASSES[code] is the label.
+VITAL_CLASSES = ("Missing", "Normal", "Abnormal", "OutOfRange")
+MISSING, NORMAL, ABNORMAL, OUT_OF_RANGE = range(4)
+_VITAL_BOUNDS = {k: (*m["valid"], *m["normal"]) for k, m in VITAL_RANGES.items()}
+
+def vital_code(key: str, v) -> int:
+    if v in (None, ""):
+        return MISSING
+    try:
+        val = float(v)
+    except:
+        return MISSING
+    vmin, vmax, nmin, nmax = _VITAL_BOUNDS[key]
+    if not (vmin <= val <= vmax):
+        return OUT_OF_RANGE
+    return NORMAL if nmin <= val <= nmax else ABNORMAL
+
+def classify_vital_signs(vitals: Dict[str, float]) -> Dict[str, str]:
+    """Return Normal / Abnormal / OutOfRange / Missing for each vital."""
+    return {key: VITAL_CLASSES[vital_code(key, vitals.get(key))] for key in VITAL_FIELDS}
+
+def classify_vital_signs_batch(values):
+    """Vectorized classify_vital_signs: rows x VITAL_FIELDS floats (NaN = missing) -> int8 codes."""
+    import numpy as np
+    x = np.asarray(values, dtype=float)
+    vmin, vmax, nmin, nmax = np.array([_VITAL_BOUNDS[k] for k in VITAL_FIELDS], dtype=float).T
+    codes = np.full(x.shape, ABNORMAL, dtype=np.int8)
+    codes[(x >= nmin) & (x <= nmax)] = NORMAL
+    codes[(x < vmin) | (x > vmax)] = OUT_OF_RANGE
+    codes[np.isnan(x)] = MISSING
+    return codes
+
+def vitals_any_out_of_range(vital_classes: Dict[str, str]) -> bool:
+    return any(v == "OutOfRange" for v in vital_classes.values())
+
+# قواعدك
+import app.rules as rules_mod
+from app.rules import determine_ctas_fired, display_desc, num, NUMERIC_FIELDS, FALLBACK, RULES
+from app.metrics import REGISTRY, STAGE_SECONDS
+
+RULE_FIRES = REGISTRY.counter("triage_rule_fired_total", "Patients triaged for whom the rule fired (memo hits included).",
+                              ("rule", "ctas", "desc"))
+RULE_LABELS = [(str(i), str(r.level), display_desc(r.desc)) for i, r in enumerate(RULES)]
+FALLBACK_LABELS = (("fallback", str(FALLBACK[0]), FALLBACK[1]),)
+TRIAGES = REGISTRY.counter("triage_patients_total", "Patients triaged, by level and whether the memo answered.",
+                           ("ctas", "memo"))
+
+VITALS_VERSION = hashlib.sha1(repr(VITAL_RANGES).encode()).hexdigest()[:12]
+# memoized (vital_classes, ctas_level, reason) per normalized input; 0 disables
+TRIAGE_MEMO_SIZE = int(os.environ.get("TRIAGE_MEMO_SIZE", "4096"))
+triage_memo = VersionedLRU(lambda: (rules_mod.RULESET_VERSION, VITALS_VERSION), max_entries=TRIAGE_MEMO_SIZE)
+
+def triage_key(vitals_full: dict, chief_complaint, history, symptoms_bool, distress_level):
+    """Canonical form of everything classify_vital_signs and determine_ctas look at, or None."""
+    key = (tuple(num(vitals_full.get(k)) for k in NUMERIC_FIELDS),
+           tuple(vitals_full.get(k) or "" for k in ("Location_of_Pain", "Pain_Duration", "blood_glucose_symptoms")),
+           (chief_complaint or "").lower(), (history or "").lower(), bool(symptoms_bool), distress_level or "")
+    try:
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+def triage(vitals_full: dict, chief_complaint, history, symptoms_bool: bool, distress_level):
+    """Classify vitals, run the rules and build the record to persist."""
+    key = triage_key(vitals_full, chief_complaint, history, symptoms_bool, distress_level) if TRIAGE_MEMO_SIZE else None
+    hit = triage_memo.get(key) if key is not None else None
+    if hit is not None:
+        vital_classes, ctas_level, reason, fired = dict(hit[0]), hit[1], list(hit[2]), hit[3]
+    else:
+        # dict مختصر للrules (بدون None) لتفادي مقارنات مع None
+        vitals_for_rules = {k: v for k, v in vitals_full.items() if v not in (None, "")}
+
+        with STAGE_SECONDS.time("classify_vital_signs"):
+            vital_classes = classify_vital_signs(vitals_full)
+
+        # determine_ctas قد يعتمد على وجود/غياب المفاتيح
+        with STAGE_SECONDS.time("determine_ctas"):
+            ctas_level, reason, fired = determine_ctas_fired(vitals_for_rules, chief_complaint or "", history or "",
+                                                             symptoms_bool, distress_level or "")
+        fired = tuple(fired)
+        if key is not None:
+            triage_memo.put(key, (dict(vital_classes), ctas_level, tuple(reason), fired))
+    RULE_FIRES.inc_all([RULE_LABELS[i] for i in fired] if fired else FALLBACK_LABELS)
+    TRIAGES.inc(str(ctas_level), "hit" if hit is not None else "miss")
+
+    record = {
+        "timestamp": str(datetime.now()),
+        "vitals": vitals_full,
+        "symptoms_present": symptoms_bool,
+        "chief_complaint": chief_complaint or "",
+        "history": history or "",
+        "distress_level": distress_level or "",
+        "ctas_level": ctas_level,
+        "reason": reason
+    }
+    return vital_classes, ctas_level, reason, record
+
+# form field -> vitals key, shared by /api/triage/batch and app.retriage
+VITAL_INPUTS = {
+    "systolic": "Systolic", "diastolic": "Diastolic", "hr": "hr", "temp": "TEMPERATURE",
+    "o2_sat": "O2_Sat", "rr": "RR", "gcs": "GCS", "pain_scale": "Pain_Scale",
+    "location_of_pain": "Location_of_Pain", "pain_duration": "Pain_Duration",
+    "blood_glucose": "blood_glucose", "blood_glucose_symptoms": "blood_glucose_symptoms"
+}
+
+def form_inputs(patient: dict) -> tuple:
+    """/process form field names -> triage() arguments (vitals_full, chief, history, symptoms, distress)."""
+    sp = patient.get("symptoms_present")
+    symptoms_bool = sp is True or (isinstance(sp, str) and sp.lower() == "yes")
+    vitals_full = {key: patient.get(field) for field, key in VITAL_INPUTS.items()}
+    return vitals_full, patient.get("chief_complaint"), patient.get("history"), symptoms_bool, patient.get("distress_level")
+
+def triage_json(i: int, patient) -> tuple:
+    """One batch item (same field names as the /process form) -> (result line, record or None)."""
+    if not isinstance(patient, dict):
+        return {"index": i, "error": "patient must be a JSON object"}, None
+    vital_classes, ctas_level, reason, record = triage(*form_inputs(patient))
+    out = {"index": i, "ctas_level": ctas_level, "reason": reason, "vital_classes": vital_classes,
+           "out_of_range": vitals_any_out_of_range(vital_classes)}
+    if "id" in patient:
+        out["id"] = patient["id"]
+    return out, record
+
+def triage_chunk(start: int, patients: list) -> tuple:
+    """triage_json over consecutive items -> (NDJSON text, records to store)."""
+    lines, records = [], []
+    for i, patient in enumerate(patients, start):
+        out, record = triage_json(i, patient)
+        lines.append(json.dumps(out, ensure_ascii=False) + "\n")
+        if record is not None: records.append(record)
+    return "".join(lines), records
+
+class BatchReader:
+    """Incremental parser for a batch body (a JSON array, or NDJSON): feed() bytes as they
+    arrive and get back the items completed so far. Malformed input raises ValueError with
+    a message meant for the client."""
+
+    def __init__(self, ndjson: bool):
+        self.ndjson = ndjson
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.decoder = json.JSONDecoder()
+        self.buf = ""
+        self.base = 0               # chars consumed before buf, for error positions
+        self.lineno = 0             # NDJSON lines consumed
+        self.state = "start"        # array: start -> value/sep ... -> end
+
+    def feed(self, data: bytes, final: bool = False) -> list:
+        self.buf += self.text.decode(data, final)
+        return self._lines(final) if self.ndjson else self._array(final)
+
+    def _lines(self, final: bool) -> list:
+        lines = self.buf.split("\n")
+        self.buf = "" if final else lines.pop()
+        out = []
+        for ln in lines:
+            self.lineno += 1
+            if not ln.strip(): continue
+            try:
+                out.append(json.loads(ln))
+            except ValueError as e:
+                raise ValueError(f"Invalid JSON on line {self.lineno}: {e}")
+        return out
+
+    def _array(self, final: bool) -> list:
+        out, buf, pos = [], self.buf, 0
+        while True:
+            while pos < len(buf) and buf[pos] in " \t\r\n": pos += 1
+            if pos == len(buf):
+                break
+            ch = buf[pos]
+            if self.state == "start":
+                if ch != "[": raise ValueError("Expected a JSON array or NDJSON stream of patients")
+                self.state, pos = "first", pos + 1
+            elif self.state in ("first", "sep") and ch == "]":
+                self.state, pos = "end", pos + 1
+            elif self.state == "sep":
+                if ch != ",": raise ValueError(f"Invalid JSON: Expecting ',' delimiter at char {self.base + pos}")
+                self.state, pos = "value", pos + 1
+            elif self.state == "value" and ch == "]":
+                raise ValueError(f"Invalid JSON: Expecting value at char {self.base + pos}")
+            elif self.state in ("first", "value"):
+                try:
+                    item, end = self.decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError as e:
+                    if final: raise ValueError(f"Invalid JSON: {e.msg} at char {self.base + e.pos}")
+                    break           # wait for the rest of this item
+                if not final and type(item) in (int, float) and not buf[end:].strip("0123456789.eE+-"):
+                    break           # a number ending the chunk (e.g. `12` or `5.`) may go on in the next one
+                out.append(item)
+                pos = end
+                self.state = "sep"
+            else:
+                raise ValueError(f"Invalid JSON: Extra data at char {self.base + pos}")
+        self.buf, self.base = buf[pos:], self.base + pos
+        if final and self.state not in ("start", "end"):
+            raise ValueError("Invalid JSON: unterminated array")
+        return out
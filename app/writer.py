@@ -0,0 +1,134 @@
+import asyncio, logging, time
+from typing import Callable, List, Optional
+
+from app.storage import Storage
+
+class WriteQueue:
+    """Group-commit writer for records and feedback.
+
+    Handlers enqueue and return immediately; a single background task collects items
+    until `max_batch` or `max_delay` seconds after the first one, then writes the group
+    through Storage.write_rows in a worker thread (one fsync per batch). A failed write is
+    retried for the rows that did not reach storage only; refreshing the view afterwards
+    is not retried. Before start() and after stop(), writes go straight to storage.
+    `on_written(recs, fbs)` is called on the event loop with the rows written.
+    """
+
+    def __init__(self, storage: Storage, max_batch: int = 256, max_delay: float = 0.05, retries: int = 3,
+                 on_written: Optional[Callable[[List[dict], List[dict]], None]] = None):
+        self.storage = storage
+        self.on_written = on_written
+        self.max_batch, self.max_delay, self.retries = max_batch, max_delay, retries
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.running = False
+        self.pending_last: Optional[dict] = None     # newest record not yet flushed
+        self.batches = self.written = self.dropped = 0
+        self.last_flush_ms = self.max_flush_ms = self.total_flush_ms = 0.0
+
+    def start(self):
+        self.queue = asyncio.Queue()
+        self.running = True
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        """Stop accepting, flush everything queued, and wait for the writer to exit."""
+        if not self.running: return
+        self.running = False
+        self.queue.put_nowait(None)
+        await self.task
+
+    def put_records(self, recs: List[dict]):
+        if not recs: return
+        if not self.running:
+            self._write_now(recs, [])
+            return
+        for r in recs: self.queue.put_nowait(("record", r))
+        self.pending_last = recs[-1]
+
+    def put_record(self, rec: dict):
+        self.put_records([rec])
+
+    def put_feedback(self, fb: dict):
+        if not self.running:
+            self._write_now([], [fb])
+            return
+        self.queue.put_nowait(("feedback", fb))
+
+    def _write_now(self, recs, fbs):
+        self.storage.write_batch(recs, fbs)
+        self._notify(recs, fbs)
+
+    def _notify(self, recs, fbs):
+        if self.on_written is None: return
+        try:
+            self.on_written(recs, fbs)
+        except Exception as e:
+            logging.error(f"on_written hook failed: {e}")
+
+    def last_record(self) -> dict:
+        return self.pending_last or self.storage.last_record()
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue.qsize() if self.queue else 0,
+            "running": self.running,
+            "batches": self.batches, "written": self.written, "dropped": self.dropped,
+            "last_flush_ms": round(self.last_flush_ms, 3), "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self.total_flush_ms / self.batches, 3) if self.batches else None,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        done = False
+        while not done:
+            item = await self.queue.get()
+            batch = []
+            if item is None: done = True
+            else: batch.append(item)
+            deadline = loop.time() + self.max_delay
+            while not done and len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0: break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None: done = True
+                else: batch.append(item)
+            if done:    # drain whatever was queued before stop()
+                while not self.queue.empty():
+                    item = self.queue.get_nowait()
+                    if item is not None: batch.append(item)
+            if batch:
+                await self._flush(batch)
+
+    async def _flush(self, batch):
+        recs = [o for k, o in batch if k == "record"]
+        fbs = [o for k, o in batch if k == "feedback"]
+        pending = {"records": recs, "feedback": fbs}      # write_rows() removes what it stored
+        for attempt in range(1, self.retries + 1):
+            t0 = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.storage.write_rows, pending)
+            except Exception as e:
+                logging.error(f"Write batch failed (attempt {attempt}/{self.retries}): {e}")
+                await asyncio.sleep(0.1 * attempt)
+                continue
+            ms = (time.perf_counter() - t0) * 1000
+            self.last_flush_ms = ms; self.max_flush_ms = max(self.max_flush_ms, ms); self.total_flush_ms += ms
+            break
+        if recs and self.pending_last is recs[-1]: self.pending_last = None
+        lost = sum(len(rows) for rows in pending.values())
+        if lost:
+            self.dropped += lost
+            logging.error(f"Dropped {lost} queued writes after {self.retries} attempts")
+        recs = [] if "records" in pending else recs
+        fbs = [] if "feedback" in pending else fbs
+        if not (recs or fbs): return
+        self.batches += 1; self.written += len(recs) + len(fbs)
+        try:
+            await asyncio.to_thread(self.storage.after_write)
+        except Exception as e:
+            logging.error(f"Refresh after write failed (rows are stored): {e}")
+        self._notify(recs, fbs)
@@ -0,0 +1,179 @@
+"""Concurrent-writer stress test for the JSONL backend.
+
+    python -m tests.stress_storage
+    python -m tests.stress_storage --procs 16 --records 600 --rotate-kb 256 --repeat 5
+
+Each process opens its own JsonlStorage on one shared directory, as uvicorn workers do,
+and appends records in batches (plus feedback) while the logs rotate every --rotate-kb.
+Once every process has finished writing, each one refreshes and reports its view. A run
+fails (exit status 1) unless the lines on disk (sealed segments + active file) are exactly
+the ones written with none torn, every worker's view, as well as a storage reopened from
+the saved indexes, agrees with the disk, and no worker took a live seal for a crashed one. Scripted interleavings of two workers
+around a seal run first, since random runs only hit those orderings by luck.
+"""
+import argparse, json, logging, multiprocessing as mp, os, queue, shutil, sys, tempfile, time
+from collections import Counter
+
+from app.storage import LEVELS, JsonlStorage, iter_log_lines, save_lines_json
+
+def make_record(wid: int, i: int, pad: int) -> dict:
+    return {"w": wid, "i": i, "ctas_level": 1 + (wid + i) % 5, "timestamp": f"2026-01-01 00:{wid % 60:02d}:{i % 60:02d}",
+            "chief_complaint": "stress", "history": "x" * (pad + 97 * wid % pad if pad else 0)}
+
+def make_feedback(wid: int, i: int) -> dict:
+    return {"w": wid, "i": i, "decision": "accept" if i % 3 else "decline", "ctas_level": 1 + i % 5,
+            "timestamp": f"2026-01-01 00:00:{i % 60:02d}"}
+
+def store(d: str, rotate_bytes: int = 1 << 30) -> JsonlStorage:
+    s = JsonlStorage(os.path.join(d, "records.json"), os.path.join(d, "feedback.json"), rotate_bytes=rotate_bytes)
+    s.open()
+    return s
+
+def view(s: JsonlStorage) -> dict:
+    acc, rej = s.feedback_by_ctas()
+    return {**s.counts(), "totals": s.ctas_totals(), "acc": acc, "rej": rej}
+
+class Recoveries(logging.Handler):
+    """Counts "Finishing interrupted seal" warnings; nothing crashes in these runs."""
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.n = 0
+    def emit(self, record):
+        self.n += "interrupted seal" in record.getMessage()
+
+def writer(d: str, wid: int, args, done, go, out):
+    recoveries = Recoveries()
+    logging.getLogger().addHandler(recoveries)
+    s = store(d, args.rotate_kb * 1024)
+    for i in range(0, args.records, args.batch):
+        s.append_records([make_record(wid, j, args.pad) for j in range(i, min(i + args.batch, args.records))])
+        if i % (args.batch * 4) == 0:
+            s.append_feedback(make_feedback(wid, i))
+    done.put(wid)
+    go.wait()           # everyone is done writing; no more appends or rotations
+    out.put((wid, {**view(s), "recoveries": recoveries.n}))
+    s.close()
+
+def disk_view(d: str) -> dict:
+    """Totals read straight from the files, plus the ids seen and the lines that did not parse."""
+    seen, torn, totals = Counter(), 0, {k: 0 for k in LEVELS}
+    fb = {"feedback": 0, "accepted": 0, "declined": 0, "acc": {k: 0 for k in LEVELS}, "rej": {k: 0 for k in LEVELS}}
+    for ln in iter_log_lines(os.path.join(d, "records.json")):
+        try:
+            r = json.loads(ln)
+        except ValueError:
+            torn += 1; continue
+        seen[(r["w"], r["i"])] += 1
+        totals[f"CTAS {r['ctas_level']}"] += 1
+    for ln in iter_log_lines(os.path.join(d, "feedback.json")):
+        try:
+            f = json.loads(ln)
+        except ValueError:
+            torn += 1; continue
+        fb["feedback"] += 1
+        ok = f["decision"] == "accept"
+        fb["accepted" if ok else "declined"] += 1
+        fb["acc" if ok else "rej"][f"CTAS {f['ctas_level']}"] += 1
+    return {"seen": seen, "torn": torn, "records": sum(seen.values()), "totals": totals, **fb}
+
+def compare(name: str, v: dict, disk: dict) -> list:
+    keys = ("records", "feedback", "accepted", "declined", "totals", "acc", "rej")
+    return [f"{name}: {k} {v[k]} != disk {disk[k]}" for k in keys if v[k] != disk[k]]
+
+def seal(s: JsonlStorage):
+    """Seal the active records file now, as maybe_rotate() does once it is due."""
+    due, s.records.rotate_bytes = s.records.rotate_bytes, 1
+    s.records.maybe_rotate()
+    s.records.rotate_bytes = due
+
+# Orderings of two workers (a, b) around a seal that random runs only hit by luck; each is a
+# list of steps (worker, action, records to append).
+INTERLEAVINGS = {
+    "append between refresh and seal": [("a", "append", 3), ("a", "refresh", 0), ("b", "write", 2), ("a", "seal", 0)],
+    "other worker seals after ours": [("a", "append", 3), ("a", "seal", 0), ("b", "append", 2), ("b", "seal", 0),
+                                      ("b", "append", 1), ("a", "refresh", 0)],
+    "seal while other worker is idle": [("a", "append", 2), ("b", "refresh", 0), ("a", "seal", 0), ("a", "append", 2),
+                                        ("a", "seal", 0), ("b", "refresh", 0)],
+}
+
+def run_interleaving(steps) -> list:
+    d = tempfile.mkdtemp(prefix="triage-stress-")
+    try:
+        workers, n = {"a": store(d), "b": store(d)}, 0
+        for w, action, count in steps:
+            s, recs = workers[w], [make_record(ord(w), n + k, 10) for k in range(count)]
+            n += count
+            if action == "append": s.append_records(recs)
+            elif action == "write": save_lines_json(s.records_path, recs)    # appended without refreshing
+            elif action == "refresh": s.refresh()
+            elif action == "seal": seal(s)
+        disk = disk_view(d)
+        problems = [p for w, s in workers.items() for p in compare(f"worker {w}", view(s), disk)]
+        for s in workers.values(): s.close()
+        return problems + compare("reopened", view(store(d)), disk)
+    finally:
+        shutil.rmtree(d, ignore_errors=True)
+
+def run_once(args) -> dict:
+    d = tempfile.mkdtemp(prefix="triage-stress-")
+    try:
+        ctx = mp.get_context("spawn")
+        done, go, out = ctx.Queue(), ctx.Event(), ctx.Queue()
+        t0 = time.perf_counter()
+        procs = [ctx.Process(target=writer, args=(d, w, args, done, go, out)) for w in range(args.procs)]
+        for p in procs: p.start()
+        finished = set()
+        while len(finished) < len(procs):
+            try:
+                finished.add(done.get(timeout=1))
+            except queue.Empty:
+                if any(p.exitcode is not None for w, p in enumerate(procs) if w not in finished): break    # one crashed
+        secs = time.perf_counter() - t0
+        go.set()
+        views = dict(out.get(timeout=600) for _ in finished)
+        for p in procs: p.join()
+        disk = disk_view(d)
+        problems = [f"worker {w} exited with {p.exitcode}" for w, p in enumerate(procs) if p.exitcode]
+        want = {(w, i) for w in range(args.procs) for i in range(args.records)}
+        missing, dup = want - set(disk["seen"]), [k for k, n in disk["seen"].items() if n > 1]
+        if missing: problems.append(f"{len(missing)} records missing on disk, e.g. {sorted(missing)[:5]}")
+        if dup: problems.append(f"{len(dup)} records written twice, e.g. {sorted(dup)[:5]}")
+        if disk["torn"]: problems.append(f"{disk['torn']} torn lines on disk")
+        for w, v in sorted(views.items()):
+            problems += compare(f"worker {w}", v, disk)
+            if v["recoveries"]: problems.append(f"worker {w} finished {v['recoveries']} seal(s) it took for interrupted")
+        problems += compare("reopened", view(store(d, args.rotate_kb * 1024)), disk)
+        segments = sum(1 for n in os.listdir(d) if n.startswith("records.json.") and n.endswith(".gz"))
+        return {"records": disk["records"], "feedback": disk["feedback"], "segments": segments,
+                "seconds": round(secs, 2), "problems": problems}
+    finally:
+        if args.keep: print(f"kept {d}", file=sys.stderr)
+        else: shutil.rmtree(d, ignore_errors=True)
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="python -m tests.stress_storage", description="Many processes writing one JSONL store at once.")
+    ap.add_argument("--procs", type=int, default=12, help="writer processes")
+    ap.add_argument("--records", type=int, default=400, help="records per process")
+    ap.add_argument("--batch", type=int, default=5, help="records per append")
+    ap.add_argument("--pad", type=int, default=4000, help="approximate bytes of padding per record")
+    ap.add_argument("--rotate-kb", type=int, default=512, help="rotate the logs past this size")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--keep", action="store_true", help="keep the data directory of each run")
+    args = ap.parse_args(argv)
+    failed = 0
+    for name, steps in INTERLEAVINGS.items():
+        problems = run_interleaving(steps)
+        print(f"{name}: {'FAIL' if problems else 'ok'}")
+        for p in problems: print(f"  {p}")
+        failed += bool(problems)
+    for n in range(args.repeat):
+        res = run_once(args)
+        status = "FAIL" if res["problems"] else "ok"
+        print(f"run {n + 1}: {status}  {res['records']} records, {res['feedback']} feedback, "
+              f"{res['segments']} segments, {res['seconds']}s")
+        for p in res["problems"]: print(f"  {p}")
+        failed += bool(res["problems"])
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""KeywordMatcher.find() has `term in text` semantics for every term."""
+import random
+
+from app.keywords import KeywordMatcher
+from app.rules import MATCHER
+
+# overlapping and nested terms: prefixes, suffixes, repeats, one term inside another
+TRICKY = ["a", "ab", "abc", "bc", "bcd", "cd", "aa", "aaa", "aab", "ba", "abab", "bab", "c"]
+
+def check(terms, texts):
+    m = KeywordMatcher(terms)
+    for text in texts:
+        want = {t for t in m.terms if t in text}
+        assert m.find(text) == want, (text, sorted(want ^ m.find(text)))
+
+def test_tricky_terms_random_texts():
+    rnd = random.Random(2)
+    for _ in range(200):
+        terms = rnd.sample(TRICKY, rnd.randint(1, len(TRICKY)))
+        check(terms, ("".join(rnd.choice("abcd") for _ in range(rnd.randint(0, 30))) for _ in range(50)))
+
+def test_rule_terms_glued_together():
+    rnd = random.Random(3)
+    terms = sorted(MATCHER.terms)
+    texts = []
+    for _ in range(3000):
+        words = [rnd.choice(terms) for _ in range(rnd.randint(0, 5))] + rnd.sample(["x", " ", "pt", "no", "the"], 2)
+        rnd.shuffle(words)
+        text = rnd.choice(["", " "]).join(words)
+        k = rnd.randint(0, len(text))
+        texts += [text, text[k:], text[:k]]     # cuts land inside terms too
+    check(terms, texts)
+
+def test_empty():
+    assert KeywordMatcher([]).find("anything") == frozenset()
+    assert KeywordMatcher(["a", ""]).find("") == frozenset()
+    assert KeywordMatcher(["a", ""]).terms == frozenset({"a"})
@@ -0,0 +1,90 @@
+"""determine_ctas against the outputs of the original if-chain implementation.
+
+golden_ctas.json holds the keywords the rules match (also as each rule's chief/history
+combination) and the (level, reasons) that the pre-rule-table determine_ctas returned for
+`cases` inputs drawn with `seed`: vitals at and around every threshold, unparseable
+values, and keywords glued to filler or to each other. Any difference is a behaviour
+change. Rewrite the file only from that original:
+
+    git show b103921:app/rules.py > /tmp/rules_orig.py
+    python -m tests.test_rules_golden /tmp/rules_orig.py
+"""
+import importlib.util, json, os, random, sys
+
+from app.rules import RULES, determine_ctas
+
+GOLDEN = os.path.join(os.path.dirname(__file__), "golden_ctas.json")
+SEED, CASES = 20261017, 5000
+
+NUMERIC = {
+    "Systolic": [59, 89, 90, 150, 199, 200, 200.5, 220, 220.1, 221, 260],
+    "Diastolic": [40, 59, 60, 109, 110, 130, 131, 150],
+    "GCS": [3, 8, 9, 9.5, 10, 13, 13.5, 14, 15, 16],
+    "O2_Sat": [80, 89.9, 90, 91, 92, 93, 94, 94.5, 95, 100],
+    "RR": [8, 20, 30],
+    "TEMPERATURE": [34, 34.9, 35, 36.5, 37.9, 38, 38.1, 40],
+    "hr": [40, 50, 51, 99, 100, 101, 129, 130, 180, 181],
+    "Pain_Scale": [0, 0.5, 1, 3, 3.5, 4, 7, 7.5, 8, 10, 11],
+    "blood_glucose": [30, 49, 50, 120, 300, 301, 450],
+}
+ODD = [None, "", "abc", "nan"]
+TEXT = {
+    "Location_of_Pain": ["Central", "Peripheral", "central", ""],
+    "Pain_Duration": ["Acute", "Chronic", "Subacute", "acute", ""],
+    "blood_glucose_symptoms": ["Confusion", "Diaphoresis", "Behavioural Change", "Seizure", "Acute Focal Deficits",
+                               "Dyspnea", "Dehydration", "Tachypnea", "Thirst", "Polyuria", "Weakness", "None", ""],
+}
+DISTRESS = ["Severe", "Moderate", "Mild", "None", "", "severe"]
+FILLER = ["pt", "c/o", "since", "yesterday", "WELL", "with", "and", "no", "the", "x"]
+
+def cases(terms, combos, n: int, seed: int):
+    """determine_ctas() argument tuples; the same for the same terms, combos, n and seed."""
+    rnd = random.Random(seed)
+
+    def text(most: int, start=()) -> str:
+        words = [*start, *(rnd.choice(terms) for _ in range(rnd.randint(0, most)))]
+        words += [rnd.choice(FILLER) for _ in range(rnd.randint(0, 3))]
+        rnd.shuffle(words)
+        s = rnd.choice([" ", "", ", "]).join(words)     # "" glues terms together
+        return s.upper() if rnd.random() < 0.1 else s
+
+    for _ in range(n):
+        vitals = {}
+        for k, vals in NUMERIC.items():
+            r = rnd.random()
+            if r < 0.3: continue
+            v = rnd.choice(vals) if r < 0.9 else rnd.choice(ODD)
+            vitals[k] = str(v) if v is not None and rnd.random() < 0.2 else v
+        for k, vals in TEXT.items():
+            if rnd.random() < 0.7: vitals[k] = rnd.choice(vals)
+        chief, hist = rnd.choice(combos) if rnd.random() < 0.3 else ((), ())
+        yield vitals, text(3, chief), text(2, hist), rnd.random() < 0.5, rnd.choice(DISTRESS)
+
+def test_determine_ctas_matches_golden():
+    with open(GOLDEN, encoding="utf-8") as f:
+        g = json.load(f)
+    bad = []
+    for i, (args, (level, reasons)) in enumerate(zip(cases(g["terms"], g["combos"], g["cases"], g["seed"]), g["expected"])):
+        want = (level, [g["reasons"][j] for j in reasons])
+        got = determine_ctas(*args)
+        if (got[0], list(got[1])) != want:
+            bad.append((i, args, want, got))
+    assert not bad, f"{len(bad)} of {g['cases']} cases differ, first: {bad[0]}"
+
+def write_golden(rules_path: str):
+    spec = importlib.util.spec_from_file_location("rules_orig", rules_path)
+    orig = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(orig)
+    terms = sorted({t for r in RULES for t in (*r.chief, *r.chief_none, *(x for grp in r.chief_any for x in grp), *r.hist_any)})
+    combos = [[[*r.chief, *(grp[0] for grp in r.chief_any)], list(r.hist_any[:1])] for r in RULES if r.chief or r.chief_any]
+    reasons, expected = {}, []
+    for args in cases(terms, combos, CASES, SEED):
+        level, why = orig.determine_ctas(*args)
+        expected.append([level, [reasons.setdefault(w, len(reasons)) for w in why]])
+    with open(GOLDEN, "w", encoding="utf-8") as f:
+        json.dump({"seed": SEED, "cases": CASES, "terms": terms, "combos": combos, "reasons": list(reasons), "expected": expected},
+                  f, ensure_ascii=False, separators=(",", ":"))
+    print(f"wrote {CASES} cases, {len(reasons)} distinct reasons to {GOLDEN}")
+
+if __name__ == "__main__":
+    write_golden(sys.argv[1])